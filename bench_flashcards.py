@@ -0,0 +1,284 @@
+"""
+Benchmarks for the flashcards deck.
+
+Run with: python bench_flashcards.py [lookup|stream|startup|schedule|mistakes|script|fuzzy|server] [--cards N]
+       python bench_flashcards.py server [--sessions N] [--rounds N] [--address HOST:PORT]
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import resource
+import tempfile
+import time
+
+from flashcards import (Card, CardStore, FlashCard, RingLog, StreamIO, edit_distance, normalize, read_text_deck,
+                        start_server, write_binary_deck, write_text_deck)
+
+
+def write_deck(file_name, size):
+    with open(file_name, "w") as file:
+        for i in range(size):
+            file.write(f"term{i} definition{i} {i % 7}\n")
+
+
+def load(deck):
+    # as with -imp, the deck is imported before the menu reads its first command
+    deck.run(StreamIO(["exit"], io.StringIO()))
+
+
+def legacy_import(file_name):
+    # the list based import used before the card store
+    cards, terms = [], []
+    with open(file_name, "r") as file:
+        for pair in file.read().splitlines():
+            f_term, f_definition, f_mistakes = pair.split()
+            if f_term in terms:
+                cards.pop(terms.index(f_term))
+                terms.remove(f_term)
+            cards.append(Card(f_term, f_definition, int(f_mistakes)))
+            terms.append(f_term)
+    return cards, terms
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_import_and_lookup(sizes=(1_000, 5_000, 20_000, 100_000), legacy_limit=20_000):
+    print("cards      legacy import   store import   legacy lookup   store lookup")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            file_name = os.path.join(tmp, f"deck_{size}.txt")
+            write_deck(file_name, size)
+            probes = [f"definition{i}" for i in range(0, size, max(1, size // 1000))]
+
+            deck = FlashCard(file_name, "")
+            store_import, _ = timed(load, deck)
+            store_lookup, _ = timed(lambda: [deck.cards.find_definition(p) for p in probes])
+
+            if size <= legacy_limit:
+                legacy_time, (_, terms) = timed(legacy_import, file_name)
+                definitions = [f"definition{i}" for i in range(size)]
+                legacy_lookup, _ = timed(lambda: [terms[definitions.index(p)] for p in probes])
+                legacy = f"{legacy_time:12.4f}s   "
+                legacy_probe = f"{legacy_lookup:12.4f}s   "
+            else:
+                legacy = legacy_probe = f"{'skipped':>13}   "
+            print(f"{size:<10} {legacy} {store_import:11.4f}s   {legacy_probe} {store_lookup:11.4f}s")
+
+
+def max_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_stream(size=10_000_000):
+    # cards are generated and consumed on the fly, so the resident size only
+    # reflects the import/export buffers and not the deck itself
+    with tempfile.TemporaryDirectory() as tmp:
+        file_name = os.path.join(tmp, "deck.txt")
+        cards = (Card(f"term{i}", f"definition{i}", i % 7) for i in range(size))
+        export_time, saved = timed(write_text_deck, file_name, cards)
+        file_size = os.path.getsize(file_name) / 2 ** 20
+        print(f"export: {saved} cards, {file_size:.0f} MiB in {export_time:.2f}s "
+              f"({saved / export_time:,.0f} cards/s), max rss {max_rss_mb():.0f} MiB")
+
+        def read_all():
+            return sum(len(batch) for batch in read_text_deck(file_name))
+
+        import_time, loaded = timed(read_all)
+        print(f"import: {loaded} cards in {import_time:.2f}s "
+              f"({loaded / import_time:,.0f} cards/s), max rss {max_rss_mb():.0f} MiB")
+
+
+def bench_binary_startup(sizes=(10_000, 100_000, 1_000_000)):
+    print("cards      text import   binary import   first lookup")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            text_name = os.path.join(tmp, f"deck_{size}.txt")
+            binary_name = os.path.join(tmp, f"deck_{size}.deck")
+            write_deck(text_name, size)
+            write_binary_deck(binary_name, (Card(f"term{i}", f"definition{i}", i % 7) for i in range(size)))
+
+            text_deck, binary_deck = FlashCard(text_name, ""), FlashCard(binary_name, "")
+            text_time, _ = timed(load, text_deck)
+            binary_time, _ = timed(load, binary_deck)
+            lookup_time, card = timed(binary_deck.cards.find_definition, f"definition{size // 2}")
+            assert card.term == f"term{size // 2}"
+            print(f"{size:<10} {text_time:10.4f}s   {binary_time:12.6f}s   {lookup_time:11.6f}s")
+
+
+def bench_schedule(size=1_000_000, reviews=1_000_000, seed=0):
+    # a simulated learner is more likely to answer well the easier a card has become
+    rng = random.Random(seed)
+    cards = CardStore()
+    cards.add_many(Card(f"term{i}", f"definition{i}", 0) for i in range(size))
+    build_time, _ = timed(cards.next_card)
+
+    def simulate():
+        correct_answers = 0
+        for _ in range(reviews):
+            card = cards.next_card()
+            correct = rng.random() < card.ease / 3
+            cards.review(card, correct)
+            correct_answers += correct
+        return correct_answers
+
+    review_time, correct_answers = timed(simulate)
+    print(f"{size} cards, heap built in {build_time:.2f}s")
+    print(f"{reviews} reviews in {review_time:.2f}s ({reviews / review_time:,.0f} reviews/s), "
+          f"{correct_answers / reviews:.1%} correct, clock at {cards.schedule.clock}")
+
+
+def bench_mistakes(size=1_000_000, mistakes=1_000_000, seed=0):
+    # wrong answers recorded on random cards, then the hardest ones read from the board against a full sort
+    rng = random.Random(seed)
+    cards = CardStore()
+    cards.add_many(Card(f"term{i}", f"definition{i}", 0) for i in range(size))
+    deck = list(cards)
+
+    def record():
+        for _ in range(mistakes):
+            cards.board.record_mistake(rng.choice(deck))
+
+    record_time, _ = timed(record)
+    sort_time, ranked = timed(lambda: sorted(deck, key=lambda card: -card.mistakes))
+    print(f"{size} cards, {mistakes} mistakes recorded in {record_time:.2f}s "
+          f"({mistakes / record_time:,.0f} mistakes/s), full sort {sort_time * 1000:.0f} ms")
+    for k in (1, 10, 100, 1000):
+        top_time, top = timed(cards.top, k)
+        assert [card.mistakes for card in top] == [card.mistakes for card in ranked[:k]], k
+        print(f"top {k:>4}: {top_time * 1e6:10.1f} us")
+    reset_time, _ = timed(cards.reset_mistakes)
+    assert not cards.top(1)
+    print(f"reset stats: {reset_time * 1000:.0f} ms")
+
+
+def bench_script(actions=300_000):
+    # a recorded session replayed through the batch driver, as with --script
+    lines = []
+    for i in range(actions // 6):
+        lines += ["add", f"term{i}", f"definition{i}", "ask", "1", f"definition{i // 2}",
+                  "hardest card", "remove", f"term{i // 3}", "reset stats", "unknown"]
+    lines.append("exit")
+    deck = FlashCard("", "", log=RingLog(1000))
+    output = io.StringIO()
+    run_time, _ = timed(deck.run, StreamIO(lines, output))
+    print(f"{actions} menu actions ({len(lines)} lines, {output.tell() / 2 ** 20:.0f} MiB of output) "
+          f"in {run_time:.2f}s: {actions / run_time:,.0f} actions/s")
+
+
+def bench_fuzzy(size=50_000, queries=20, seed=0):
+    # near-miss answers looked up through the deletion index against a brute force scan
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    words = {"".join(rng.choice(letters) for _ in range(rng.randint(6, 12))) for _ in range(size)}
+    cards = CardStore()
+    cards.fuzzy = 1
+    cards.add_many(Card(f"term{i}", word, 0) for i, word in enumerate(words))
+    build_time, _ = timed(cards.get_matcher)
+
+    probes = []
+    for word in rng.sample(sorted(words), queries):
+        position = rng.randrange(len(word))
+        probes.append(word[:position] + rng.choice(letters) + word[position + 1:])
+
+    def brute_force():
+        return [next((card for card in cards if edit_distance(normalize(probe), normalize(card.definition)) <= 1),
+                     None) for probe in probes]
+
+    index_time, found = timed(lambda: [cards.find_answer(probe, None) for probe in probes])
+    brute_time, _ = timed(brute_force)
+    print(f"{len(words)} definitions, index built in {build_time:.2f}s")
+    print(f"{queries} near misses: index {index_time / queries * 1000:.2f} ms/query, "
+          f"brute force {brute_time / queries * 1000:.2f} ms/query, {sum(map(bool, found))} matched")
+
+
+async def read_until(reader, prefix):
+    while True:
+        line = await reader.readline()
+        if not line:
+            raise ConnectionError("server closed the session")
+        if line.startswith(prefix):
+            return
+
+
+async def learner(address, number, rounds, latencies):
+    host, _, port = address.rpartition(":")
+    if port.isdigit():
+        reader, writer = await asyncio.open_connection(host, int(port))
+    else:
+        reader, writer = await asyncio.open_unix_connection(address)
+    await read_until(reader, b"Input the action")
+    for i in range(rounds):
+        # every other answer is wrong so both paths of ask are exercised
+        answer = f"definition{number + i}" if i % 2 else "wrong"
+        for line, prompt in (("ask", b"How many"), ("1", b"Print the definition"),
+                             (answer, b"Input the action"), ("hardest card", b"Input the action")):
+            start = time.perf_counter()
+            writer.write(f"{line}\n".encode())
+            await read_until(reader, prompt)
+            latencies.append(time.perf_counter() - start)
+    writer.write(b"exit\n")
+    await read_until(reader, b"Bye bye!")
+    writer.close()
+    await writer.wait_closed()
+
+
+async def load_test(sessions, rounds, address, cards=10_000):
+    # without an address a server on a temporary Unix socket is started in this process
+    server = None
+    with tempfile.TemporaryDirectory() as tmp:
+        if not address:
+            deck = CardStore()
+            deck.add_many(Card(f"term{i}", f"definition{i}", 0) for i in range(cards))
+            address = os.path.join(tmp, "flashcards.sock")
+            server = await start_server(deck, address)
+
+        latencies = []
+        start = time.perf_counter()
+        results = await asyncio.gather(*(learner(address, number, rounds, latencies) for number in range(sessions)),
+                                       return_exceptions=True)
+        elapsed = time.perf_counter() - start
+        if server:
+            server.close()
+            await server.wait_closed()
+
+    failed = sum(isinstance(result, Exception) for result in results)
+    latencies.sort()
+    print(f"{sessions} concurrent sessions ({failed} failed), {len(latencies)} requests in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:,.0f} requests/s)")
+    for percentile in (50, 90, 99, 99.9):
+        index = min(len(latencies) - 1, int(len(latencies) * percentile / 100))
+        print(f"p{percentile}: {latencies[index] * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("bench", nargs="?", default="lookup", choices=["lookup", "stream", "startup", "schedule", "mistakes", "script",
+                                                                   "fuzzy", "server"])
+    parser.add_argument("--cards", type=int, help="deck size for the stream, schedule and mistakes benchmarks")
+    parser.add_argument("--sessions", type=int, default=2000, help="concurrent learners for the server benchmark")
+    parser.add_argument("--rounds", type=int, default=5, help="questions asked by each learner")
+    parser.add_argument("--address", default="", help="server to load test, by default one is started in-process")
+    args = parser.parse_args()
+
+    if args.bench == "lookup":
+        bench_import_and_lookup()
+    elif args.bench == "stream":
+        bench_stream(args.cards or 10_000_000)
+    elif args.bench == "startup":
+        bench_binary_startup()
+    elif args.bench == "schedule":
+        bench_schedule(args.cards or 1_000_000)
+    elif args.bench == "mistakes":
+        bench_mistakes(args.cards or 1_000_000)
+    elif args.bench == "script":
+        bench_script()
+    elif args.bench == "fuzzy":
+        bench_fuzzy()
+    else:
+        asyncio.run(load_test(args.sessions, args.rounds, args.address))
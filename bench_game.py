@@ -0,0 +1,425 @@
+"""
+Benchmarks for the knight's tour solver.
+
+Run with: python bench_game.py [warnsdorff|solver|blocks|count|cache|map|moves|render] [--sizes N ...] [--workers N]
+"""
+import argparse
+import builtins
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+
+from game import BlockTour, BoardRenderer, KnightBoard, Puzzle, SolutionCache, count_tours, solvability_map, write_path
+
+
+class StringPuzzle(Puzzle):
+    # the solver that walked the display board of strings, kept as a baseline
+
+    def __init__(self):
+        super().__init__()
+        self.initial_position = True
+        self.solution_found = False
+
+    def setup_board(self):
+        # a padded display string for every cell, kept for the life of the game
+        self.cell_size = len(str(self.x_dim))
+        self.border = f"{' ' * self.cell_size}{'-' * (self.x_dim * (self.cell_size + 2) + 3)}"
+        self.board = []
+        for i in range(self.y_dim, 0, -1):
+            self.board.append([f"{' ' * (self.cell_size - len(str(i)))}{i}|", *["_" * (self.cell_size + 1)] * self.x_dim, "|"])
+        self.board[-self.y_pos][self.x_pos] = f"{' ' * self.cell_size}X"
+        self.column_labels = f"{' ' * (self.cell_size + 1)}"
+        for i in range(1, self.x_dim + 1):
+            self.column_labels += f" {' ' * ((self.cell_size + 1) - len(str(i)))}{i}"
+        self.initial_position = True
+
+    def valid_move(self, x, y):
+        return self.board[-y][x] not in (f"{' ' * self.cell_size}*", f"{'_' * (self.cell_size + 1)}")
+
+    def print_board(self):
+        sys.stdout.write("\n".join([self.border, *map(" ".join, self.board), self.border, self.column_labels, ""]))
+
+    def possible_moves(self, x, y):
+        moves = 0
+        coordinates = []
+        for place in [(1, 2), (-1, 2), (1, -2), (-1, -2)]:
+            if (self.x_dim, self.y_dim) >= self.check(x + place[0], y + place[1]):
+                landing = self.board[-(y + place[1])][x + place[0]]  # "___"
+                if self.initial_position and landing != f"{' ' * self.cell_size}*":
+                    self.board[-(y + place[1])][x + place[0]] = f"{' ' * self.cell_size}A"
+                    coordinates.append([x + place[0], y + place[1]])
+                elif landing == f"{'_' * (self.cell_size + 1)}":
+                    moves += 1
+
+            if (self.x_dim, self.y_dim) >= self.check(x + place[1], y + place[0]):
+                landing = self.board[-(y + place[0])][x + place[1]]
+                if self.initial_position and landing != f"{' ' * self.cell_size}*":
+                    self.board[-(y + place[0])][x + place[1]] = f"{' ' * self.cell_size}A"
+                    coordinates.append([x + place[1], y + place[0]])
+                elif landing == f"{'_' * (self.cell_size + 1)}":
+                    moves += 1
+        if self.initial_position:
+            return coordinates
+        return moves
+
+    def check(self, x_value, y_value):
+        if x_value not in range(1, self.x_dim + 1) or y_value not in range(1, self.y_dim + 1):
+            return self.x_dim + 1, self.y_dim + 1
+        return x_value, y_value
+
+    def best_moves(self):
+        available_moves = list()
+        if self.initial_position:
+            available_moves = self.possible_moves(self.x_pos, self.y_pos)
+            self.initial_position = False
+            if not available_moves:
+                return available_moves
+
+        top_moves = dict()
+        for x, y in available_moves:
+            num_moves = self.possible_moves(x, y)
+            if not self.solution_found:
+                top_moves[num_moves] = [x, y]
+            else:
+                self.board[-y][x] = f"{' ' * self.cell_size}{num_moves}"
+
+        if not self.solution_found:
+            best_x, best_y = top_moves[min(top_moves)]
+            return best_x, best_y, available_moves
+        else:
+            self.print_board()
+            return available_moves
+
+    def reset_possible_moves(self, possible_moves):
+        for x, y in possible_moves:
+            self.board[-y][x] = f"{'_' * (self.cell_size + 1)}"
+
+    def user_game(self):
+        moves = self.best_moves()
+        squares_visited = 0
+        while True:
+            self.board[-self.y_pos][self.x_pos] = f"{' ' * self.cell_size}*"
+            squares_visited += 1
+            new_x, new_y = self.check_dimensions("move", "Enter your next move: ", "Invalid move!")
+            self.reset_possible_moves(moves)
+            self.x_pos = new_x
+            self.y_pos = new_y
+            self.board[-self.y_pos][self.x_pos] = f"{' ' * self.cell_size}X"
+            self.initial_position = True
+            moves = self.best_moves()
+            if not moves:
+                break
+        squares_visited += 1
+        self.print_board()
+        if squares_visited != self.x_dim * self.y_dim:
+            print("No more possible moves!")
+            print(f"Your knight visited {squares_visited} squares!")
+        else:
+            print("What a great tour! Congratulations!")
+
+    def find_solution(self):
+        starting_pos = self.x_pos, self.y_pos
+        results = self.best_moves()
+        num_squares_visited = 0
+        count = 0
+        pos_squares_visited = []
+        while True:
+            count += 1
+            num_squares_visited += 1
+            self.board[-self.y_pos][self.x_pos] = f"{' ' * self.cell_size}*"
+            pos_squares_visited.append([self.x_pos, self.y_pos])
+            self.x_pos, self.y_pos = results[0], results[1]
+            self.reset_possible_moves(results[2])
+            self.board[-self.y_pos][self.x_pos] = f"{' ' * self.cell_size}X"
+            self.initial_position = True
+            results = self.best_moves()
+            if not results:
+                break
+        self.board[-self.y_pos][self.x_pos] = f"{' ' * self.cell_size}X"
+        num_squares_visited += 1
+        if num_squares_visited != self.x_dim * self.y_dim:
+            return False
+        elif not self.try_puzzle:
+            pos_squares_visited.append([self.x_pos, self.y_pos])
+            for i, (x, y) in enumerate(pos_squares_visited):
+                self.board[-y][x] = f"{' ' * ((self.cell_size + 1) - len(str(i + 1)))}{i + 1}"
+        self.x_pos, self.y_pos = starting_pos
+        self.solution_found = True
+        return True
+
+
+def warnsdorff(knight_board, start):
+    # Warnsdorff's rule as the string solver applied it, on a KnightBoard: of the squares with
+    # the fewest onward moves, the last in KNIGHT_MOVES order
+    visited, degree, offsets = knight_board.visited, knight_board.degree, knight_board.offsets
+    path = array("l", [start])
+    knight_board.visit(start)
+    index = start
+    for _ in range(knight_board.x_dim * knight_board.y_dim - 1):
+        best, best_degree = -1, 9
+        for offset in offsets:
+            landing = index + offset
+            if not visited[landing] and degree[landing] <= best_degree:
+                best, best_degree = landing, degree[landing]
+        if best < 0:
+            break
+        index = best
+        path.append(index)
+        visited[index] = 1
+        for offset in offsets:
+            degree[index + offset] -= 1
+    return path
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def numbered_puzzle(puzzle_class, size):
+    puzzle = puzzle_class()
+    puzzle.x_dim = puzzle.y_dim = size
+    puzzle.x_pos = puzzle.y_pos = 1
+    puzzle.try_puzzle = False
+    puzzle.setup_board()
+    return puzzle
+
+
+def bench_warnsdorff(sizes=(8, 16, 32, 64, 100, 250, 500, 1000), legacy_limit=64):
+    # walks from the corner: the string solver only on the smaller boards, then Warnsdorff's
+    # rule as the string solver applied it, and with ties broken towards the edge
+    print("board        string solver     warnsdorff visited   tie-breaking visited   squares/s")
+    for size in sizes:
+        knight_board = KnightBoard(size, size)
+        elapsed, path = timed(warnsdorff, knight_board, knight_board.index(1, 1))
+        if size <= legacy_limit:
+            legacy = numbered_puzzle(StringPuzzle, size)
+            legacy_time, legacy_found = timed(legacy.find_solution)
+            puzzle = numbered_puzzle(StringPuzzle, size)
+            for i, index in enumerate(path):
+                x, y = knight_board.position(index)
+                puzzle.board[-y][x] = f"{' ' * ((puzzle.cell_size + 1) - len(str(i + 1)))}{i + 1}"
+            assert not legacy_found or puzzle.board == legacy.board, size
+            legacy_column = f"{legacy_time:12.4f}s"
+        else:
+            legacy_column = f"{'skipped':>13}"
+
+        knight_board.reset()
+        walk_time, walk = timed(knight_board.walk, knight_board.index(1, 1))
+        label = f"{size}x{size}"
+        print(f"{label:<12} {legacy_column}   {elapsed:10.4f}s {len(path) / size ** 2:7.1%}   "
+              f"{walk_time:10.4f}s {len(walk) / size ** 2:7.1%}   {len(walk) / walk_time:>9,.0f}")
+
+
+def bench_solver(boards=((5, 5), (6, 6), (7, 7), (8, 8), (3, 10), (4, 7), (5, 8)), max_nodes=1_000_000):
+    # every starting square, walked first and searched by backtracking where the walk fails
+    print("board   starts   tours   walked   backtracked   exhausted       nodes   nodes/s      time")
+    for x_dim, y_dim in boards:
+        tours = walked = backtracked = exhausted = nodes = 0
+        search_time = 0.0
+        for x in range(1, x_dim + 1):
+            for y in range(1, y_dim + 1):
+                knight_board = KnightBoard(x_dim, y_dim)
+                start = knight_board.index(x, y)
+                elapsed, path = timed(knight_board.solve, start, max_nodes)
+                tours += path is not None
+                walked += path is not None and not knight_board.nodes
+                backtracked += knight_board.nodes > 0
+                exhausted += knight_board.exhausted
+                nodes += knight_board.nodes
+                if knight_board.nodes:
+                    search_time += elapsed
+        label = f"{x_dim}x{y_dim}"
+        rate = f"{nodes / search_time:>9,.0f}" if search_time else f"{'-':>9}"
+        print(f"{label:<7} {x_dim * y_dim:>6} {tours:>7} {walked:>8} {backtracked:>13} {exhausted:>11} "
+              f"{nodes:>11} {rate} {search_time:8.2f}s")
+
+
+def bench_blocks(sizes=(100, 250, 500, 1000, 2000), workers=1):
+    # the tie-breaking walk against the block tour, walked and streamed to a path file
+    print("board        walk   squares/s      blocks   block tour   squares/s   path file        size")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            knight_board = KnightBoard(size, size)
+            walk_time, path = timed(knight_board.walk, knight_board.index(1, 1))
+            assert len(path) == size * size
+
+            block_tour = BlockTour(size, size, workers)
+            blocks_time, _ = timed(block_tour.solve_blocks)
+            tour_time, squares = timed(lambda: sum(1 for _ in block_tour.squares()))
+            assert squares == size * size
+            file_name = os.path.join(tmp, f"tour_{size}.ktp")
+            write_time, _ = timed(write_path, file_name, size, size, block_tour.squares(), True)
+            label = f"{size}x{size}"
+            print(f"{label:<10} {walk_time:7.2f}s {squares / walk_time:>11,.0f}  {blocks_time:9.3f}s  "
+                  f"{tour_time:10.2f}s {squares / tour_time:>11,.0f}  {write_time:8.2f}s "
+                  f"{os.path.getsize(file_name) / 2 ** 20:8.2f} MiB")
+
+
+def bench_count(boards=((5, 5, False), (6, 5, False), (6, 5, True), (6, 6, True)), workers=1):
+    # every tour from the corner, counted with the search split at the third move
+    print("board   tours             count        nodes      time     tours/s     nodes/s")
+    for x_dim, y_dim, closed in boards:
+        elapsed, (total, nodes) = timed(count_tours, x_dim, y_dim, (1, 1), closed, workers)
+        label, kind = f"{x_dim}x{y_dim}", "closed" if closed else "open"
+        print(f"{label:<7} {kind:<8} {total:>14} {nodes:>12} {elapsed:8.2f}s {total / elapsed:>11,.0f} "
+              f"{nodes / elapsed:>11,.0f}")
+
+
+def bench_cache(boards=((5, 5), (6, 6), (8, 8), (3, 10), (4, 7), (5, 8), (8, 5), (50, 50))):
+    # every starting square solved with an empty cache, then again in a new process's cache
+    print("board    starts     searched    hits  misses      cached   hits     time/start")
+    with tempfile.TemporaryDirectory() as tmp:
+        for x_dim, y_dim in boards:
+            times = []
+            for cache in (SolutionCache(tmp), SolutionCache(tmp)):
+                start_time = time.perf_counter()
+                for x in range(1, x_dim + 1):
+                    for y in range(1, y_dim + 1):
+                        puzzle = Puzzle()
+                        puzzle.x_dim, puzzle.y_dim, puzzle.x_pos, puzzle.y_pos = x_dim, y_dim, x, y
+                        puzzle.cache = cache
+                        puzzle.setup_board()
+                        puzzle.find_solution()
+                times.append((time.perf_counter() - start_time, cache.hits, cache.misses))
+            (first, first_hits, misses), (second, hits, _) = times
+            starts = x_dim * y_dim
+            label = f"{x_dim}x{y_dim}"
+            print(f"{label:<8} {starts:>6} {first:11.3f}s {first_hits:>7} {misses:>7} {second:10.3f}s {hits:>6} "
+                  f"{second / starts * 1e6:10.1f} us")
+
+
+def bench_map(boards=((8, 8), (5, 8), (4, 7), (20, 20), (50, 50)), workers=1):
+    # every starting square as a run of game.py solves it, against the solvability map
+    print("board    starts    one by one    starts/s    map   searched    starts/s     nodes/s")
+    for x_dim, y_dim in boards:
+        start_time = time.perf_counter()
+        for x in range(1, x_dim + 1):
+            for y in range(1, y_dim + 1):
+                puzzle = Puzzle()
+                puzzle.x_dim, puzzle.y_dim, puzzle.x_pos, puzzle.y_pos = x_dim, y_dim, x, y
+                puzzle.try_puzzle = False
+                puzzle.setup_board()
+                puzzle.find_solution()
+        one_by_one = time.perf_counter() - start_time
+        elapsed, (entries, _, searches, nodes) = timed(solvability_map, x_dim, y_dim, None, workers)
+        starts = x_dim * y_dim
+        label = f"{x_dim}x{y_dim}"
+        print(f"{label:<8} {starts:>6} {one_by_one:12.2f}s {starts / one_by_one:>11,.0f} {elapsed:6.2f}s "
+              f"{searches:>10} {starts / elapsed:>11,.0f} {nodes / elapsed:>11,.0f}")
+
+
+def play(puzzle, answers):
+    # user_game fed from a list of answers until they run out, its output kept in memory
+    answers = iter(answers)
+
+    def answer(message=""):
+        for line in answers:
+            return line
+        raise EOFError
+
+    real_input = builtins.input
+    builtins.input = answer
+    try:
+        with contextlib.redirect_stdout(io.StringIO()) as output:
+            puzzle.user_game()
+    except EOFError:
+        pass
+    finally:
+        builtins.input = real_input
+    return output.getvalue()
+
+
+def bench_moves(sizes=(8, 25, 50, 100, 200), moves=100):
+    # the first moves of the walk from the corner played in the interactive mode, then all taken back
+    print("board    moves   string board   ms/move   degree counts   ms/move   with undo/redo")
+    for size in sizes:
+        knight_board = KnightBoard(size, size)
+        path = knight_board.walk(knight_board.index(1, 1))
+        squares = [f"{x} {y}" for x, y in map(knight_board.position, path[1:moves + 1])]
+        results = []
+        for puzzle_class in (StringPuzzle, Puzzle):
+            puzzle = numbered_puzzle(puzzle_class, size)
+            puzzle.setup_board()
+            puzzle.solution_found = True
+            results.append(timed(play, puzzle, squares))
+        (legacy_time, legacy_output), (elapsed, output) = results
+        assert output == legacy_output, size
+
+        puzzle = numbered_puzzle(Puzzle, size)
+        undo_time, _ = timed(play, puzzle, squares + ["undo"] * len(squares) + ["redo"] * len(squares))
+        label = f"{size}x{size}"
+        print(f"{label:<8} {len(squares):>5} {legacy_time:13.3f}s {legacy_time / len(squares) * 1000:9.3f} "
+              f"{elapsed:14.3f}s {elapsed / len(squares) * 1000:9.3f} {undo_time:15.3f}s")
+
+
+def bench_render(sizes=(100, 500, 1000, 2000), radius=10):
+    # a numbered tour printed from the string grid, row by row as print_board did, against the
+    # renderer writing it from an array of numbers, and a viewport frame around the knight
+    print("board    string grid   peak MiB   numbers array   peak MiB   viewport frame")
+    for size in sizes:
+        path = BlockTour(size, size).squares()
+        numbers = array("I", bytes(4 * size * size))
+        for i, (x, y) in enumerate(path):
+            numbers[(y - 1) * size + x - 1] = i + 1
+
+        def string_grid():
+            puzzle = numbered_puzzle(StringPuzzle, size)
+            cell_size = puzzle.cell_size
+            for y, row in enumerate(puzzle.board):
+                start = (size - y - 1) * size
+                row[1:-1] = [f"{' ' * ((cell_size + 1) - len(str(number)))}{number}"
+                             for number in numbers[start:start + size]]
+            with contextlib.redirect_stdout(io.StringIO()):
+                print(puzzle.border)
+                for line in puzzle.board:
+                    print(" ".join(line))
+                print(puzzle.border)
+                print(puzzle.column_labels)
+
+        renderer = BoardRenderer(size, size)
+        results = []
+        for function in (string_grid, lambda: renderer.write_numbers(io.StringIO(), numbers)):
+            elapsed, _ = timed(function)
+            # traced apart, as tracing slows every allocation down
+            tracemalloc.start()
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            results.append(f"{elapsed:12.2f}s {peak / 2 ** 20:10.1f}")
+        columns, rows = renderer.window(size // 2, size // 2, radius)
+        frame_time, _ = timed(renderer.frame, lambda x, y: renderer.empty, columns, rows)
+        label = f"{size}x{size}"
+        print(f"{label:<8} {results[0]}   {results[1]}   {frame_time * 1e6:11.0f} us")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("bench", nargs="?", default="warnsdorff", choices=["warnsdorff", "solver", "blocks", "count", "cache", "map",
+                                                                     "moves", "render"])
+    parser.add_argument("--sizes", type=int, nargs="+", help="board sides to solve")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="processes for the block tours, counting tours and the solvability map")
+    args = parser.parse_args()
+
+    if args.bench == "warnsdorff":
+        bench_warnsdorff(*[args.sizes] if args.sizes else [])
+    elif args.bench == "blocks":
+        bench_blocks(*[args.sizes] if args.sizes else [], workers=args.workers)
+    elif args.bench == "count":
+        bench_count(workers=args.workers)
+    elif args.bench == "cache":
+        bench_cache()
+    elif args.bench == "map":
+        bench_map(workers=args.workers)
+    elif args.bench == "moves":
+        bench_moves(*[args.sizes] if args.sizes else [])
+    elif args.bench == "render":
+        bench_render(*[args.sizes] if args.sizes else [])
+    else:
+        bench_solver()
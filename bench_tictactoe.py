@@ -0,0 +1,288 @@
+"""
+Benchmarks for the tic-tac-toe AI.
+
+Run with: python bench_tictactoe.py [tree|cache|book|openings|large|random|mcts]
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from tictactoe import (FULL, INVERSES, MOVES, SYMMETRIES, TRANSPOSITIONS, WINS, Board, OpeningBook, TicTac,
+                       TranspositionTable, board_rules, build_book, canonical, deepening, mcts, negamax, reachable_positions,
+                       to_move)
+
+
+class ListTicTac:
+    # the list based minimax used before the bitboard engine, kept as a baseline
+
+    def __init__(self, ai_player, human_player):
+        self.ai_player = ai_player
+        self.human_player = human_player
+        self.nodes = 0
+
+    @staticmethod
+    def check_state(board, player1, player2):
+        states = [board[0:7:3], board[1:8:3], board[2:9:3]]
+        states.extend([board[:3], board[3:6], board[6:9]])
+        states.extend([board[0:9:4], board[2:7:2]])
+        if [player1] * 3 in states:
+            return 'Win'
+        elif [player2] * 3 in states:
+            return 'Loss'
+        elif '_' in board:
+            return None
+        return 'Draw'
+
+    def minimax(self, new_cells, current_player):
+        self.nodes += 1
+        state = self.check_state(new_cells, self.ai_player, self.human_player)
+        if state == 'Loss':
+            return {"score": -10}
+        elif state == 'Win':
+            return {"score": 10}
+        elif state == 'Draw':
+            return {"score": 0}
+
+        moves = []
+        for i, cell in enumerate(new_cells):
+            if cell == '_':
+                new_cells[i] = current_player
+                other = self.human_player if current_player == self.ai_player else self.ai_player
+                moves.append({"index": i, "score": self.minimax(new_cells, other)["score"]})
+                new_cells[i] = cell
+
+        pick = max if current_player == self.ai_player else min
+        best_score = pick(move["score"] for move in moves)
+        return next(move for move in moves if move["score"] == best_score)
+
+
+class RejectionTicTac(TicTac):
+    # the random and medium moves used before the empty cell list and the line counters,
+    # kept as a baseline: random cells are drawn until an empty one comes up
+
+    def best_move(self):
+        move = None
+        x, o = self.board.x, self.board.o
+        rules = self.board.rules
+        for mask in rules.windows:
+            free = mask & ~(x | o)
+            if free and ((x & mask).bit_count() == rules.win - 1 or (o & mask).bit_count() == rules.win - 1):
+                move = free.bit_length() - 1
+
+        if move is None:
+            move = random.randrange(0, rules.cells)
+        return move
+
+    def choose_move(self, level, marker):
+        while True:
+            if level == "medium":
+                move = self.best_move()
+            else:
+                move = random.randrange(0, self.board.rules.cells)
+            if self.board.cell(move) == "_":
+                return move
+
+
+def full_tree_search(me, opp, counter):
+    # the bitboard search without a table, pruning or move ordering, as it first replaced the list one
+    counter[0] += 1
+    if WINS[opp]:
+        return -10, None
+    free = FULL & ~(me | opp)
+    if not free:
+        return 0, None
+    best_score, best_cell = -10000, None
+    for cell in MOVES[free]:
+        score = -full_tree_search(opp, me | 1 << cell, counter)[0]
+        if score > best_score:
+            best_score, best_cell = score, cell
+    return best_score, best_cell
+
+
+def full_width_search(me, opp, counter, table):
+    # the transposition table search without pruning or move ordering, kept as a baseline
+    counter[0] += 1
+    if WINS[opp]:
+        return -10, None
+    free = FULL & ~(me | opp)
+    if not free:
+        return 0, None
+    key, symmetry = canonical(me, opp)
+    entry = table.entries.get(key)
+    if entry is not None:
+        return entry[0], INVERSES[symmetry][entry[1]]
+    best_score, best_cell = -10000, None
+    for cell in MOVES[free]:
+        score = -full_width_search(opp, me | 1 << cell, counter, table)[0]
+        if score > best_score:
+            best_score, best_cell = score, cell
+    table.entries[key] = best_score, SYMMETRIES[symmetry][best_cell]
+    return best_score, best_cell
+
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def bench_full_tree():
+    # the full game tree from the empty board, on lists and on bitboards, then the search the
+    # first "hard" move of a game runs now
+    legacy = ListTicTac('X', 'O')
+    legacy_time, legacy_move = timed(legacy.minimax, ['_'] * 9, 'X')
+
+    counter = [0]
+    bitboard_time, (score, cell) = timed(full_tree_search, 0, 0, counter)
+    assert score == legacy_move["score"] and cell == legacy_move["index"], (score, cell, legacy_move)
+
+    game = new_game()
+    TRANSPOSITIONS.clear()
+    search_time, move = timed(game.minimax, Board(), 'X')
+    # scores now count the moves to the end, only the outcome has to agree
+    assert (move["score"] > 0) - (move["score"] < 0) == legacy_move["score"] // 10, (move, legacy_move)
+
+    for name, nodes, elapsed in (("list", legacy.nodes, legacy_time), ("bitboard", counter[0], bitboard_time),
+                                 ("alpha-beta", game.nodes[0], search_time)):
+        print(f"{name:<10} {nodes} nodes in {elapsed:.3f}s: {nodes / elapsed:,.0f} nodes/s")
+
+
+def new_game():
+    game = TicTac()
+    game.ai_player, game.human_player = 'X', 'O'
+    return game
+
+
+def bench_cache(games=1000):
+    # cold search, then "hard" moves for every position of many games with the table warm
+    TRANSPOSITIONS.clear()
+    game = new_game()
+    cold_time, _ = timed(game.minimax, Board(), 'X')
+    lookups = TRANSPOSITIONS.hits + TRANSPOSITIONS.misses
+    print(f"cold: {game.nodes[0]} nodes in {cold_time * 1000:.1f} ms, {len(TRANSPOSITIONS.entries)} canonical "
+          f"positions stored, hit rate {TRANSPOSITIONS.hits / lookups:.1%}")
+
+    moves = 0
+    hits_before = TRANSPOSITIONS.hits
+    start = time.perf_counter()
+    for _ in range(games):
+        game = new_game()
+        marker = 'X'
+        while TicTac.check_state(game.board, 'X', 'O', show_outcome=False) is None:
+            game.board.play(game.minimax(game.board, marker)["index"], marker)
+            marker = 'O' if marker == 'X' else 'X'
+            moves += 1
+    elapsed = time.perf_counter() - start
+    print(f"warm: {moves} hard moves in {elapsed:.3f}s, {elapsed / moves * 1e6:.1f} us/move, "
+          f"{TRANSPOSITIONS.hits - hits_before} hits, {len(TRANSPOSITIONS.entries)} positions stored")
+
+
+def bench_book():
+    # hard moves for every reachable position, from a book built apart from the real one and from a cold search
+    with tempfile.TemporaryDirectory() as tmp:
+        book = OpeningBook(os.path.join(tmp, "tictactoe.book"))
+        build_time, _ = timed(build_book, book.path)
+        positions = reachable_positions()
+        game = new_game()
+        boards = []
+        for x, o in positions:
+            board = Board()
+            board.set_position(x, o)
+            boards.append((board, to_move(x, o)))
+
+        def book_moves():
+            # the lookup TicTac.book_move makes in the module's book, which has every position
+            for board, _ in boards:
+                assert book.lookup(board.x, board.o) is not None
+
+        def searched_moves():
+            TRANSPOSITIONS.clear()
+            for board, marker in boards:
+                game.minimax(board, marker)
+
+        book_time, _ = timed(book_moves)
+        search_time, _ = timed(searched_moves)
+    print(f"book of {len(positions)} positions built in {build_time:.2f}s")
+    print(f"book moves: {book_time / len(positions) * 1e6:.2f} us/move (including the first load), "
+          f"search from a cold table: {search_time / len(positions) * 1e6:.2f} us/move")
+
+
+def bench_openings():
+    # the empty board and each first move of X, searched from a cold table by both engines
+    print("opening   full width nodes      time   alpha-beta nodes      time")
+    for first in [None] + list(range(9)):
+        x = 0 if first is None else 1 << first
+        me, opp = (x, 0) if first is None else (0, x)
+        results = []
+        for search in (full_width_search, negamax):
+            counter = [0]
+            elapsed, _ = timed(search, me, opp, counter, TranspositionTable())
+            results.append(f"{counter[0]:>16} {elapsed * 1000:>7.2f} ms")
+        label = "empty" if first is None else f"X on {first}"
+        print(f"{label:<9} {results[0]}   {results[1]}")
+
+
+def bench_large(variants=((4, 4), (5, 4), (7, 5), (15, 5)), budget=1.0):
+    # the first reply to a center opening, searched as deep as the budget allows
+    print("board  win      nodes   nodes/s   move")
+    for size, win in variants:
+        rules = board_rules(size, win)
+        counter = [0]
+        elapsed, move = timed(deepening, rules, 0, 1 << rules.center, budget, counter)
+        label = f"{size}x{size}"
+        print(f"{label:<6} {win:<4} {counter[0]:>9} {counter[0] / elapsed:>9,.0f}   {move}")
+
+
+def bench_random_moves(variants=((3, 3, 100_000), (15, 5, 1_000)), seed=0):
+    # headless games of the random and medium levels, as a tournament plays them
+    print("board  pairing          rejection games/s   empty cell list games/s")
+    for size, win, games in variants:
+        for levels in (("easy", "easy"), ("easy", "medium"), ("medium", "medium")):
+            rates = []
+            for game in (RejectionTicTac(size, win), TicTac(size, win)):
+                random.seed(seed)
+                elapsed, _ = timed(lambda: [game.headless_game(*levels) for _ in range(games)])
+                rates.append(games / elapsed)
+            label, pairing = f"{size}x{size}", " vs ".join(levels)
+            print(f"{label:<6} {pairing:<16} {rates[0]:>19,.0f}   {rates[1]:>23,.0f}")
+
+
+def bench_mcts(variants=((3, 3), (7, 5), (15, 5)), seconds=1.0):
+    # the reply to a center opening, in one process and spread over every core
+    workers = os.cpu_count()
+    print(f"board  win   playouts/s   {workers} workers playouts/s   move")
+    for size, win in variants:
+        rules = board_rules(size, win)
+        random.seed(0)
+        elapsed, (visits, playouts) = timed(mcts, rules, 0, 1 << rules.center, None, seconds)
+        game = TicTac(size, win, seconds, mcts_workers=workers)
+        game.board.play(rules.center, 'X')
+        game.mcts_move('O')
+        if game.mcts_pool:
+            game.mcts_pool.shutdown()
+        label = f"{size}x{size}"
+        print(f"{label:<6} {win:<4} {playouts / elapsed:>11,.0f}   {game.mcts_stats[0] / game.mcts_stats[1]:>20,.0f}"
+              f"   {max(visits, key=visits.get)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("bench", nargs="?", default="tree", choices=["tree", "cache", "book", "openings", "large", "random", "mcts"])
+    args = parser.parse_args()
+
+    if args.bench == "tree":
+        bench_full_tree()
+    elif args.bench == "cache":
+        bench_cache()
+    elif args.bench == "book":
+        bench_book()
+    elif args.bench == "openings":
+        bench_openings()
+    elif args.bench == "large":
+        bench_large()
+    elif args.bench == "random":
+        bench_random_moves()
+    else:
+        bench_mcts()
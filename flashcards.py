@@ -1,47 +1,821 @@
 # Write your code here
 import argparse
+import asyncio
+import bisect
+import heapq
+import mmap
+import os
+import shutil
+import struct
+import sys
+import unicodedata
+import zlib
+from array import array
+from collections import deque
+from functools import cached_property
+
+BATCH_SIZE = 65536
+BUFFER_SIZE = 1 << 20
+SESSION_LOG_LINES = 1000
+
+# Binary deck layout, all integers little-endian:
+#   header | string table | offset index | mistakes | term hash table | definition hash table | schedule
+# The offset index holds 2 * count + 1 positions into the string table, card i spans
+# [offsets[2i], offsets[2i + 1]) for the term and [offsets[2i + 1], offsets[2i + 2]) for
+# the definition. The hash tables use open addressing and store card index + 1 (0 is empty).
+# The schedule (version 2) packs the due, interval, reps and ease arrays back to back.
+BINARY_MAGIC = b"FCDK"
+BINARY_VERSION = 2
+BINARY_SUFFIX = ".deck"
+BINARY_HEADER_V1 = struct.Struct("<4sHHQQQQQQQ")
+BINARY_HEADER = struct.Struct("<4sHHQQQQQQQQ")
+
+# SM-2 spaced repetition, time is counted in reviews
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+MAX_INTERVAL = 2 ** 31 - 1
 
 
 class Card:
 
-    def __init__(self, user_term, user_definition, user_mistakes) -> None:
+    def __init__(self, user_term, user_definition, user_mistakes,
+                 due=0, interval=0, ease=DEFAULT_EASE, reps=0) -> None:
         self.term = user_term
         self.definition = user_definition
         self.mistakes = user_mistakes
+        # scheduling state
+        self.due = due
+        self.interval = interval
+        self.ease = ease
+        self.reps = reps
+        self.entry = None
+
+
+class MappedCard(Card):
+    # term and definition are only decoded from the mapped deck when first read
+
+    def __init__(self, deck, index) -> None:
+        self.deck = deck
+        self.index = index
+        self.order = index
+        self.mistakes = deck.mistakes[index]
+        self.entry = None
+        if deck.schedule:
+            self.due, self.interval, self.reps, self.ease = (values[index] for values in deck.schedule)
+        else:
+            self.due, self.interval, self.ease, self.reps = 0, 0, DEFAULT_EASE, 0
+
+    @cached_property
+    def term(self):
+        return self.deck.string(2 * self.index)
+
+    @cached_property
+    def definition(self):
+        return self.deck.string(2 * self.index + 1)
+
+
+class MappedDeck:
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        with open(file_name, "rb") as file:
+            self.map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = struct.unpack_from("<4sH", self.map)
+        if magic != BINARY_MAGIC or version not in (1, BINARY_VERSION):
+            raise ValueError(f"{file_name} is not a supported binary deck")
+        header = BINARY_HEADER_V1 if version == 1 else BINARY_HEADER
+        (_, _, _, self.count, self.slots, _, offsets_at, mistakes_at,
+         terms_at, definitions_at, *schedule_at) = header.unpack_from(self.map)
+
+        self.offsets = self.section("Q", offsets_at, 2 * self.count + 1)
+        self.mistakes = self.section("I", mistakes_at, self.count)
+        self.term_table = self.section("I", terms_at, self.slots)
+        self.definition_table = self.section("I", definitions_at, self.slots)
+        self.schedule = None
+        if schedule_at:
+            start = schedule_at[0]
+            self.schedule = (self.section("Q", start, self.count),
+                             self.section("I", start + 8 * self.count, self.count),
+                             self.section("I", start + 12 * self.count, self.count),
+                             self.section("f", start + 16 * self.count, self.count))
+
+    def section(self, type_code, start, length):
+        view = memoryview(self.map)[start:start + length * array(type_code).itemsize]
+        if sys.byteorder == "little":
+            return view.cast(type_code)
+        values = array(type_code, view)
+        values.byteswap()
+        return values
+
+    def string(self, position):
+        return str(self.map[self.offsets[position]:self.offsets[position + 1]], "utf-8")
+
+    def find(self, table, text, position, skip=()):
+        key = text.encode()
+        mask = self.slots - 1
+        slot = zlib.crc32(key) & mask
+        while table[slot]:
+            index = table[slot] - 1
+            start = self.offsets[2 * index + position]
+            if index not in skip and self.map[start:self.offsets[2 * index + position + 1]] == key:
+                return index
+            slot = (slot + 1) & mask
+        return None
+
+    def find_term(self, term, skip=()):
+        return self.find(self.term_table, term, 0, skip)
+
+    def find_definition(self, definition, skip=()):
+        # duplicated definitions probe in card order, so the first card is found first
+        return self.find(self.definition_table, definition, 1, skip)
+
+
+def is_binary_deck(file_name):
+    with open(file_name, "rb") as file:
+        return file.read(len(BINARY_MAGIC)) == BINARY_MAGIC
+
+
+class MistakeBoard:
+    # cards bucketed by their number of mistakes, cards without mistakes are not tracked
+
+    def __init__(self):
+        self.buckets = {}
+        self.counts = []  # sorted distinct counts of the non-empty buckets
+
+    def add(self, card):
+        if card.mistakes:
+            bucket = self.buckets.get(card.mistakes)
+            if bucket is None:
+                bucket = self.buckets[card.mistakes] = {}
+                bisect.insort(self.counts, card.mistakes)
+            bucket[card] = None
+
+    def discard(self, card):
+        bucket = self.buckets.get(card.mistakes)
+        if bucket is None or card not in bucket:
+            return
+        del bucket[card]
+        if not bucket:
+            del self.buckets[card.mistakes]
+            del self.counts[bisect.bisect_left(self.counts, card.mistakes)]
+
+    def record_mistake(self, card):
+        self.discard(card)
+        card.mistakes += 1
+        self.add(card)
+
+    def hardest(self):
+        # the cards sharing the highest count, in deck order
+        if not self.counts:
+            return 0, []
+        max_value = self.counts[-1]
+        return max_value, sorted(self.buckets[max_value], key=lambda card: card.order)
+
+    def top(self, k):
+        # the k cards with the most mistakes, ties in the order they reached their count
+        result = []
+        for count in reversed(self.counts):
+            for card in self.buckets[count]:
+                if len(result) == k:
+                    return result
+                result.append(card)
+        return result
+
+    def reset(self):
+        for bucket in self.buckets.values():
+            for card in bucket:
+                card.mistakes = 0
+        self.buckets = {}
+        self.counts = []
+
+
+class Scheduler:
+    # min-heap of (due, ease, order, card), harder cards first among those due together.
+    # A card's current entry is card.entry, older entries are skipped when they reach the top.
+
+    def __init__(self):
+        self.heap = None
+        self.clock = 0
+
+    def build(self, cards):
+        self.heap = [self.entry(card) for card in cards]
+        heapq.heapify(self.heap)
+
+    @staticmethod
+    def entry(card):
+        card.entry = (card.due, card.ease, card.order, card)
+        return card.entry
+
+    def push(self, card):
+        if self.heap is not None:
+            heapq.heappush(self.heap, self.entry(card))
+
+    @staticmethod
+    def drop(card):
+        card.entry = None
+
+    def next_card(self):
+        heap = self.heap
+        while heap and heap[0][3].entry is not heap[0]:
+            heapq.heappop(heap)
+        return heap[0][3] if heap else None
+
+    def review(self, card, correct):
+        now = max(self.clock, card.due)
+        if correct:
+            card.reps += 1
+            if card.reps == 1:
+                card.interval = 1
+            elif card.reps == 2:
+                card.interval = 6
+            else:
+                card.interval = min(MAX_INTERVAL, round(card.interval * card.ease))
+            card.ease += 0.1
+        else:
+            card.reps = 0
+            card.interval = 1
+            card.ease = max(MIN_EASE, card.ease - 0.2)
+        card.due = now + card.interval
+        self.clock = now + 1
+        self.push(card)
+
+
+def normalize(text):
+    # ignores case, accents and runs of whitespace
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    return " ".join(text.casefold().split())
+
+
+def edit_distance(first, second):
+    if len(first) < len(second):
+        first, second = second, first
+    previous = list(range(len(second) + 1))
+    for i, char in enumerate(first, 1):
+        current = [i]
+        for j, other in enumerate(second, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (char != other)))
+        previous = current
+    return previous[-1]
+
+
+def deletions(word, max_distance):
+    # every string reachable from word by deleting up to max_distance characters
+    found = {word}
+    layer = {word}
+    for _ in range(max_distance):
+        layer = {variant[:i] + variant[i + 1:] for variant in layer for i in range(len(variant))}
+        found |= layer
+    return found
+
+
+class DeletionIndex:
+    # two words within edit distance d share a string reachable by at most d deletions from
+    # each, so only words sharing a deletion variant with the query need a distance check
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        self.variants = {}
+
+    def add(self, word):
+        for variant in deletions(word, self.max_distance):
+            self.variants.setdefault(variant, set()).add(word)
+
+    def search(self, word):
+        candidates = set()
+        for variant in deletions(word, self.max_distance):
+            candidates |= self.variants.get(variant, set())
+        found = [(edit_distance(word, candidate), candidate) for candidate in candidates]
+        return sorted(match for match in found if match[0] <= self.max_distance)
+
+
+class DefinitionMatcher:
+    # normalized definitions, and a deletion index over them when typos are tolerated
+
+    def __init__(self, max_distance):
+        self.max_distance = max_distance
+        self.cards = {}
+        self.index = DeletionIndex(max_distance) if max_distance else None
+
+    def add(self, card):
+        key = normalize(card.definition)
+        bucket = self.cards.get(key)
+        if bucket is None:
+            bucket = self.cards[key] = {}
+            if self.index:
+                self.index.add(key)
+        bucket[card] = None
+
+    def discard(self, card):
+        # the index keeps the word, its empty bucket just stops matching
+        self.cards.get(normalize(card.definition), {}).pop(card, None)
+
+    def matches(self, card, answer):
+        key, target = normalize(answer), normalize(card.definition)
+        if key == target:
+            return True
+        if not self.max_distance or self.cards.get(key):
+            # a typo never counts when the answer is another card's definition
+            return False
+        return edit_distance(key, target) <= self.max_distance
+
+    def find(self, answer, exclude):
+        key = normalize(answer)
+        keys = [key]
+        if self.index:
+            keys += [word for _, word in self.index.search(key) if word != key]
+        for word in keys:
+            for card in self.cards.get(word, ()):
+                if card is not exclude:
+                    return card
+        return None
+
+
+class CardStore:
+
+    def __init__(self):
+        self.by_term = {}
+        # cards sharing a definition in the order they were added, the first one answers for them
+        self.by_definition = {}
+        self.board = MistakeBoard()
+        self.schedule = Scheduler()
+        self.next_order = 0
+        # None for exact answers only, otherwise the edit distance tolerated on normalized answers
+        self.fuzzy = None
+        self.matcher = None
+        # cards of a memory-mapped deck are only materialized when they are used
+        self.base = None
+        self.base_cards = {}
+        self.base_removed = set()
+        self.base_scanned = True
+
+    def __len__(self):
+        base_count = self.base.count - len(self.base_removed) if self.base else 0
+        return base_count + len(self.by_term)
+
+    def __iter__(self):
+        if self.base:
+            for index in range(self.base.count):
+                if index not in self.base_removed:
+                    yield self.base_card(index)
+        yield from self.by_term.values()
+
+    def __contains__(self, term):
+        return self.get(term) is not None
+
+    def attach(self, deck):
+        self.base = deck
+        self.base_cards = {}
+        self.base_removed = set()
+        self.base_scanned = False
+        self.next_order = max(self.next_order, deck.count)
+        # built again from the whole store, with the deck's cards, when next needed
+        self.schedule.heap = None
+        self.matcher = None
+
+    def scan_base(self):
+        # the mistakes of a mapped deck join the board the first time it is queried
+        if not self.base_scanned:
+            for index, mistakes in enumerate(self.base.mistakes):
+                if (mistakes or index in self.base_cards) and index not in self.base_removed:
+                    self.board.add(self.base_card(index))
+            self.base_scanned = True
+
+    def base_card(self, index):
+        card = self.base_cards.get(index)
+        if card is None:
+            card = self.base_cards[index] = MappedCard(self.base, index)
+        return card
+
+    def base_lookup(self, index):
+        return None if index is None else self.base_card(index)
+
+    def get(self, term):
+        card = self.by_term.get(term)
+        if card is None and self.base:
+            card = self.base_lookup(self.base.find_term(term, self.base_removed))
+        return card
+
+    def find_definition(self, definition):
+        bucket = self.by_definition.get(definition)
+        card = next(iter(bucket)) if bucket else None
+        if card is None and self.base:
+            card = self.base_lookup(self.base.find_definition(definition, self.base_removed))
+        return card
+
+    def has_definition(self, definition):
+        return self.find_definition(definition) is not None
+
+    def add(self, card):
+        # an existing card with the same term is replaced and moved to the end
+        self.remove(card.term)
+        card.order = self.next_order
+        self.next_order += 1
+        self.by_term[card.term] = card
+        self.by_definition.setdefault(card.definition, {})[card] = None
+        self.board.add(card)
+        self.schedule.push(card)
+        if self.matcher:
+            self.matcher.add(card)
+
+    def add_many(self, cards):
+        for card in cards:
+            self.add(card)
+
+    def remove(self, term):
+        card = self.by_term.pop(term, None)
+        if card is not None:
+            bucket = self.by_definition[card.definition]
+            del bucket[card]
+            if not bucket:
+                del self.by_definition[card.definition]
+        elif self.base:
+            card = self.base_lookup(self.base.find_term(term, self.base_removed))
+            if card is not None:
+                self.base_removed.add(card.index)
+                del self.base_cards[card.index]
+        if card is not None:
+            self.board.discard(card)
+            self.schedule.drop(card)
+            if self.matcher:
+                self.matcher.discard(card)
+        return card
+
+    def get_matcher(self):
+        # built from the whole deck on the first fuzzy lookup, then kept up to date
+        if self.matcher is None:
+            self.matcher = DefinitionMatcher(self.fuzzy)
+            for card in self:
+                self.matcher.add(card)
+        return self.matcher
+
+    def is_answer(self, card, answer):
+        if answer == card.definition:
+            return True
+        return self.fuzzy is not None and self.get_matcher().matches(card, answer)
+
+    def find_answer(self, answer, card):
+        # the card whose definition a wrong answer gives
+        other = self.find_definition(answer)
+        if other is None and self.fuzzy is not None:
+            other = self.get_matcher().find(answer, card)
+        return other
+
+    def load(self, file_name, progress=None):
+        if is_binary_deck(file_name):
+            deck = MappedDeck(file_name)
+            if len(self):
+                self.add_many(MappedCard(deck, index) for index in range(deck.count))
+            else:
+                # only the header and index are touched, cards are decoded on first use
+                self.attach(deck)
+            return deck.count
+
+        loaded = 0
+        for batch in read_text_deck(file_name):
+            self.add_many(batch)
+            loaded += len(batch)
+            if progress:
+                progress(loaded)
+        return loaded
+
+    def next_card(self):
+        # the heap is only built once cards are asked, not while a deck is loading
+        if self.schedule.heap is None:
+            self.schedule.build(self)
+        return self.schedule.next_card()
+
+    def review(self, card, correct):
+        if not correct:
+            self.board.record_mistake(card)
+        self.schedule.review(card, correct)
+
+    def hardest(self):
+        self.scan_base()
+        return self.board.hardest()
+
+    def top(self, k):
+        self.scan_base()
+        return self.board.top(k)
+
+    def reset_mistakes(self):
+        self.scan_base()
+        self.board.reset()
+
+
+class UserCard:
+    # one learner's state for a card of a shared deck, only created once the card is asked
+    __slots__ = ("card", "order", "mistakes", "due", "interval", "ease", "reps", "entry")
+
+    def __init__(self, card):
+        self.card = card
+        self.order = card.order
+        self.mistakes = 0
+        self.due, self.interval, self.ease, self.reps = 0, 0, DEFAULT_EASE, 0
+        self.entry = None
+
+    @property
+    def term(self):
+        return self.card.term
+
+    @property
+    def definition(self):
+        return self.card.definition
+
+
+class SessionCards:
+    # a read-only view of a shared CardStore with per-learner mistakes and schedule
+
+    def __init__(self, deck):
+        self.deck = deck
+        self.overlay = {}
+        self.board = MistakeBoard()
+        self.schedule = Scheduler()
+        self.schedule.heap = []
+        # cards never asked are all due first, they are taken from the deck in order
+        self.fresh = iter(deck)
+        self.next_fresh = next(self.fresh, None)
+
+    def __len__(self):
+        return len(self.deck)
+
+    def user_card(self, card):
+        user_card = self.overlay.get(card)
+        if user_card is None:
+            user_card = self.overlay[card] = UserCard(card)
+        return user_card
+
+    def next_card(self):
+        if self.next_fresh is not None:
+            return self.user_card(self.next_fresh)
+        return self.schedule.next_card()
+
+    def review(self, user_card, correct):
+        if user_card.card is self.next_fresh:
+            self.next_fresh = next(self.fresh, None)
+        if not correct:
+            self.board.record_mistake(user_card)
+        self.schedule.review(user_card, correct)
+
+    def is_answer(self, user_card, answer):
+        return self.deck.is_answer(user_card.card, answer)
+
+    def find_answer(self, answer, user_card):
+        return self.deck.find_answer(answer, user_card.card)
+
+    def hardest(self):
+        return self.board.hardest()
+
+    def top(self, k):
+        return self.board.top(k)
+
+    def reset_mistakes(self):
+        self.board.reset()
+
+
+def read_text_deck(file_name, batch_size=BATCH_SIZE):
+    # yields lists of at most batch_size cards, the file is never fully in memory
+    batch = []
+    with open(file_name, "r", buffering=BUFFER_SIZE) as file:
+        for pair in file:
+            if not pair.strip():
+                continue
+            f_term, f_definition, f_mistakes, *f_schedule = pair.split()
+            if f_schedule:
+                f_due, f_interval, f_ease, f_reps = f_schedule
+                card = Card(f_term, f_definition, int(f_mistakes),
+                            int(f_due), int(f_interval), float(f_ease), int(f_reps))
+            else:
+                card = Card(f_term, f_definition, int(f_mistakes))
+            batch.append(card)
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def write_text_deck(file_name, cards, batch_size=BATCH_SIZE, progress=None):
+    saved = 0
+    lines = []
+    # written next to the target and swapped in, a mapped deck may still be reading the old file
+    temp_name = f"{file_name}.tmp"
+    with open(temp_name, "w", buffering=BUFFER_SIZE) as file:
+        for card in cards:
+            if card.reps or card.due:
+                lines.append(f"{card.term} {card.definition} {card.mistakes} "
+                             f"{card.due} {card.interval} {card.ease:g} {card.reps}\n")
+            else:
+                lines.append(f"{card.term} {card.definition} {card.mistakes}\n")
+            if len(lines) == batch_size:
+                file.write("".join(lines))
+                saved += len(lines)
+                lines = []
+                if progress:
+                    progress(saved)
+        file.write("".join(lines))
+        saved += len(lines)
+    os.replace(temp_name, file_name)
+    if progress:
+        progress(saved)
+    return saved
+
+
+def hash_table(hashes, slots):
+    table = array("I", bytes(4 * slots))
+    mask = slots - 1
+    for index, key_hash in enumerate(hashes):
+        # linear probing keeps equal keys in insertion order along their chain
+        slot = key_hash & mask
+        while table[slot]:
+            slot = (slot + 1) & mask
+        table[slot] = index + 1
+    return table
+
+
+def write_binary_deck(file_name, cards, batch_size=BATCH_SIZE, progress=None):
+    position = BINARY_HEADER.size
+    offsets = array("Q", [position])
+    mistakes = array("I")
+    term_hashes = array("I")
+    definition_hashes = array("I")
+    schedule = (array("Q"), array("I"), array("I"), array("f"))
+    chunk = []
+
+    def write_section(file, values, align=True):
+        if sys.byteorder != "little":
+            values = array(values.typecode, values)
+            values.byteswap()
+        if align:
+            file.write(b"\0" * (-file.tell() % 8))
+        start = file.tell()
+        values.tofile(file)
+        return start
+
+    # written next to the target and swapped in, a mapped deck may still be reading the old file
+    temp_name = f"{file_name}.tmp"
+    with open(temp_name, "wb", buffering=BUFFER_SIZE) as file:
+        file.write(bytes(BINARY_HEADER.size))
+        for card in cards:
+            term, definition = card.term.encode(), card.definition.encode()
+            chunk.append(term)
+            chunk.append(definition)
+            position += len(term)
+            offsets.append(position)
+            position += len(definition)
+            offsets.append(position)
+            mistakes.append(card.mistakes)
+            term_hashes.append(zlib.crc32(term))
+            definition_hashes.append(zlib.crc32(definition))
+            for values, value in zip(schedule, (card.due, card.interval, card.reps, card.ease)):
+                values.append(value)
+            if len(chunk) >= 2 * batch_size:
+                file.write(b"".join(chunk))
+                chunk = []
+                if progress:
+                    progress(len(mistakes))
+        file.write(b"".join(chunk))
+
+        count = len(mistakes)
+        slots = 8
+        while slots < 2 * count:
+            slots *= 2
+        offsets_at = write_section(file, offsets)
+        mistakes_at = write_section(file, mistakes)
+        terms_at = write_section(file, hash_table(term_hashes, slots))
+        definitions_at = write_section(file, hash_table(definition_hashes, slots))
+        schedule_at = write_section(file, schedule[0])
+        for values in schedule[1:]:
+            write_section(file, values, align=False)
+
+        file.seek(0)
+        file.write(BINARY_HEADER.pack(BINARY_MAGIC, BINARY_VERSION, 0, count, slots, BINARY_HEADER.size,
+                                      offsets_at, mistakes_at, terms_at, definitions_at, schedule_at))
+    os.replace(temp_name, file_name)
+    if progress:
+        progress(count)
+    return count
+
+
+def print_progress(count):
+    sys.stderr.write(f"\r{count} cards processed")
+    sys.stderr.flush()
+
+
+class MemoryLog:
+    # keeps the whole session, chunks are only joined when the log is saved
+
+    def __init__(self):
+        self.chunks = []
+
+    def write(self, text):
+        self.chunks.append(text)
+
+    def save(self, file_name):
+        with open(file_name, "w") as file:
+            file.write("".join(self.chunks))
+
+    def close(self):
+        pass
+
+
+class RingLog:
+    # keeps only the last max_lines lines of the session
+
+    def __init__(self, max_lines):
+        self.lines = deque(maxlen=max_lines)
+        self.partial = ""
+
+    def write(self, text):
+        lines = (self.partial + text).splitlines(keepends=True)
+        self.partial = lines.pop() if lines and not lines[-1].endswith("\n") else ""
+        self.lines.extend(lines)
+
+    def save(self, file_name):
+        with open(file_name, "w") as file:
+            file.writelines(self.lines)
+            file.write(self.partial)
+
+    def close(self):
+        pass
+
+
+class FileLog:
+    # streams the session to a file as it happens, saving copies that file
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self.file = open(file_name, "w", buffering=BUFFER_SIZE)
+
+    def write(self, text):
+        self.file.write(text)
+
+    def save(self, file_name):
+        self.file.flush()
+        if os.path.exists(file_name) and os.path.samefile(file_name, self.file_name):
+            return
+        with open(self.file_name, "r") as source, open(file_name, "w") as file:
+            shutil.copyfileobj(source, file, BUFFER_SIZE)
+
+    def close(self):
+        self.file.close()
+
+
+class ConsoleIO:
+
+    @staticmethod
+    def readline():
+        return input()
+
+    @staticmethod
+    def write(text):
+        sys.stdout.write(text)
+
+
+class StreamIO:
+    # replays input lines from any iterable and writes to a (buffered) text stream
+
+    def __init__(self, source, sink):
+        self.lines = iter(source)
+        self.sink = sink
+
+    def readline(self):
+        line = next(self.lines, None)
+        if line is None:
+            raise EOFError
+        return line.rstrip("\n")
+
+    def write(self, text):
+        self.sink.write(text)
 
 
 class FlashCard:
+    menu_text = "Input the action (add, remove, import, export, ask, exit, " \
+                "log, hardest card, top cards, reset stats):\n"
 
-    def __init__(self, imp_file, exp_file):
+    def __init__(self, imp_file, exp_file, progress=None, log=None, fuzzy=None):
 
-        self.log = ""
-        self.cards = []
-        self.terms = []
-        self.definitions = []
-        self.mistakes = [0]
+        self.log = log or MemoryLog()
+        self.io = ConsoleIO()
+        self.cards = CardStore()
+        self.cards.fuzzy = fuzzy
         self.imp_file = imp_file
         self.exp_file = exp_file
+        self.progress = progress
 
-    def update_mistakes(self):
-        self.mistakes = [card.mistakes for card in self.cards]
+    def say(self, text):
+        self.log.write(text)
+        self.io.write(text)
 
-    def update_cards(self):
-        self.terms = [card.term for card in self.cards]
-        self.definitions = [card.definition for card in self.cards]
-        self.update_mistakes()
+    def record(self, user_input):
+        # user input is only logged, the console already echoed it
+        self.log.write(f"{user_input}\n")
 
     def hardest_card(self):
-        max_value = max(self.mistakes)
-        if max_value:
-
-            no_max_values = self.mistakes.count(max_value)
-            max_index = -1
-            hardest_terms = []
-
-            for _ in range(no_max_values):
-                max_index = self.mistakes.index(max_value, max_index + 1)
-                hardest_terms.append(self.terms[max_index])
+        max_value, hardest = self.cards.hardest()
+        hardest_terms = [card.term for card in hardest]
 
+        if max_value:
             if len(hardest_terms) == 1:
                 text = f'The hardest card is "{hardest_terms[0]}". You have {max_value} errors answering it.\n\n'
             else:
@@ -50,207 +824,270 @@ class FlashCard:
                 text += f'". You have {max_value} errors answering them.\n\n'
         else:
             text = 'There are no cards with errors.\n\n'
-        self.log += text
-        print(text, end="")
+        self.say(text)
+
+    def top_cards(self):
+        text = "How many cards?\n"
+        self.say(text)
+        num = int((yield))
+        self.record(str(num))
+
+        top = self.cards.top(num)
+        if top:
+            text = "The hardest cards are:\n"
+            text += "".join(f'"{card.term}": {card.mistakes} errors\n' for card in top)
+            text += "\n"
+        else:
+            text = 'There are no cards with errors.\n\n'
+        self.say(text)
 
     def set_term(self):
         text = "The card:\n"
-        self.log += text
-        print(text, end="")
+        self.say(text)
 
         while True:
-            user_term = input()
-            self.log += f'{user_term}\n'
-            if self.cards and user_term in self.terms:
+            user_term = yield
+            self.record(user_term)
+            if user_term in self.cards:
                 text = f'The term "{user_term}" already exists. Try again:\n'
-                self.log += text
-                print(text, end="")
+                self.say(text)
             else:
                 return user_term
 
     def set_definition(self):
         text = f"The definition of the card:\n"
-        self.log += text
-        print(text, end="")
+        self.say(text)
         while True:
-            user_def = input()
-            self.log += f'{user_def}\n'
-            if self.cards and user_def in self.definitions:
+            user_def = yield
+            self.record(user_def)
+            if self.cards.has_definition(user_def):
                 text = f'The definition "{user_def}" already exists. Try again:\n'
-                self.log += text
-                print(text, end="")
+                self.say(text)
             else:
                 return user_def
 
     def add_card(self):
-        term = self.set_term()
-        definition = self.set_definition()
-        self.cards.append(Card(term, definition, 0))
-        self.update_cards()
+        term = yield from self.set_term()
+        definition = yield from self.set_definition()
+        self.cards.add(Card(term, definition, 0))
 
         text = f'The pair ("{term}":"{definition}") has been added.\n\n'
-        self.log += text
-        print(text, end="")
+        self.say(text)
 
     def remove_card(self):
         text = "Which card?\n"
-        self.log += text
-        print(text, end="")
-        card_name = input()
-        self.log += f'{card_name}\n'
+        self.say(text)
+        card_name = yield
+        self.record(card_name)
 
-        try:
-            index = self.terms.index(card_name)
-            self.cards.pop(index)
-            self.update_cards()
+        if self.cards.remove(card_name):
             text = "The card has been removed.\n\n"
-            self.log += text
-            print(text, end="")
-        except ValueError:
+            self.say(text)
+        else:
             text = f'Can\'t remove "{card_name}": there is no such card.\n\n'
-            self.log += text
-            print(text, end="")
+            self.say(text)
 
     def import_file(self):
         if self.imp_file:
             file_name = self.imp_file
         else:
             text = "File name:\n"
-            self.log += text
-            print(text, end="")
-            file_name = input()
-        self.log += f'{file_name}\n'
+            self.say(text)
+            file_name = yield
+        self.record(file_name)
 
         try:
-
-            with open(file_name, "r") as file:
-                pairs = file.read().splitlines()
-                for pair in pairs:
-
-                    f_term, f_definition, f_mistakes = pair.split()
-                    if f_term in self.terms:
-                        index = self.terms.index(f_term)
-                        self.cards.pop(index)
-                    self.cards.append(Card(f_term, f_definition, int(f_mistakes)))
-
-                text = f"{len(pairs)} cards have been loaded.\n\n"
-                self.log += text
-                print(text, end="")
-                self.update_cards()
+            loaded = self.cards.load(file_name, self.progress)
+            text = f"{loaded} cards have been loaded.\n\n"
+            self.say(text)
 
         except FileNotFoundError:
             text = "File not found.\n\n"
-            self.log += text
-            print(text, end="")
+            self.say(text)
 
     def export_file(self):
         if self.exp_file:
             file_name = self.exp_file
         else:
             text = "File name:\n"
-            self.log += text
-            print(text, end="")
-            file_name = input()
-        self.log += f'{file_name}\n'
+            self.say(text)
+            file_name = yield
+        self.record(file_name)
 
-        with open(file_name, "w") as file:
-            for card in self.cards:
-                file.write(f"{card.term} {card.definition} {card.mistakes}\n")
+        # a mapped deck exported back to its own file stays binary, whatever its name
+        base = self.cards.base
+        if file_name.endswith(BINARY_SUFFIX) or \
+                base and os.path.exists(file_name) and os.path.samefile(file_name, base.file_name):
+            saved = write_binary_deck(file_name, self.cards, progress=self.progress)
+        else:
+            saved = write_text_deck(file_name, self.cards, progress=self.progress)
 
-        text = f"{len(self.cards)} cards have been saved..\n\n"
-        self.log += text
-        print(text, end="")
+        text = f"{saved} cards have been saved..\n\n"
+        self.say(text)
 
     def log_console(self):
         text = "File name:\n"
-        self.log += text
-        print(text, end="")
+        self.say(text)
 
-        file_name = input()
-        self.log += f'{file_name}\n'
+        file_name = yield
+        self.record(file_name)
 
-        with open(file_name, "w") as file:
-            file.write(self.log)
-            text = "The log has been saved.\n\n"
-            self.log += text
-            print(text, end="")
+        self.log.save(file_name)
+        text = "The log has been saved.\n\n"
+        self.say(text)
 
     def ask(self):
         text = "How many times to ask?\n"
-        self.log += text
-        print(text, end="")
-        num = int(input())
-        self.log += f'{str(num)}\n'
+        self.say(text)
+        num = int((yield))
+        self.record(str(num))
 
-        for i in range(0, num):
-            card_i = i % (len(self.terms))
-            term = self.terms[card_i]
-            definition = self.definitions[card_i]
-            card_obj = self.cards[card_i]
+        for _ in range(num):
+            card_obj = self.cards.next_card()
+            if card_obj is None:
+                break
+            term = card_obj.term
+            definition = card_obj.definition
 
             text = f'Print the definition of "{term}":\n'
-            self.log += text
-            print(text, end="")
-            answer = input()
-            self.log += f'{answer}\n'
+            self.say(text)
+            answer = yield
+            self.record(answer)
 
-            if answer == definition:
+            correct = self.cards.is_answer(card_obj, answer)
+            self.cards.review(card_obj, correct)
+            other_card = None if correct else self.cards.find_answer(answer, card_obj)
+            if correct:
                 text = "Correct!\n\n"
-                self.log += text
-                print(text, end="")
-            elif answer in self.definitions:
-                card_obj.mistakes += 1
-                term_index = self.definitions.index(answer)
-                correct_term = self.terms[term_index]
+                self.say(text)
+            elif other_card:
+                correct_term = other_card.term
                 text = f'Wrong. The right answer is "{definition}", ' \
                        f'but your definition is correct for "{correct_term}".\n\n'
-                self.log += text
-                print(text, end="")
+                self.say(text)
             else:
-                card_obj.mistakes += 1
                 text = f'Wrong. The right answer is "{definition}".\n\n'
-                self.log += text
-                print(text, end="")
-        self.update_mistakes()
-        print()
+                self.say(text)
+        self.io.write("\n")
 
     def reset(self):
-        for card in self.cards:
-            card.mistakes = 0
-        self.mistakes = [0] * len(self.cards)
+        self.cards.reset_mistakes()
         text = "Card statistics have been reset.\n\n"
-        self.log += text
-        print(text, end="")
+        self.say(text)
+
+    def run(self, io):
+        # drives the menu, every line it asks for is read from io and its output goes to io
+        self.io = io
+        session = self.menu()
+        try:
+            next(session)
+            while True:
+                session.send(io.readline())
+        except StopIteration:
+            pass
+        except EOFError:
+            session.close()
 
     def start_menu(self):
-        actions = {"add": self.add_card, "remove": self.remove_card,
-                   "import": self.import_file, "export": self.export_file,
-                   "ask": self.ask, "log": self.log_console,
-                   "hardest card": self.hardest_card, "reset stats": self.reset}
+        self.run(ConsoleIO())
+
+    def actions(self):
+        return {"add": self.add_card, "remove": self.remove_card,
+                "import": self.import_file, "export": self.export_file,
+                "ask": self.ask, "log": self.log_console,
+                "hardest card": self.hardest_card, "top cards": self.top_cards,
+                "reset stats": self.reset}
+
+    def menu(self):
+        # a generator: actions that need user input yield and are sent the next line
+        actions = self.actions()
 
         if self.imp_file:
-            actions["import"]()
+            yield from actions["import"]()
 
         while True:
 
-            text_menu = "Input the action (add, remove, import, export, ask, exit, " \
-                        "log, hardest card, reset stats):\n"
-            self.log += text_menu
-            print(text_menu, end="")
+            text_menu = self.menu_text
+            self.say(text_menu)
 
-            action = input()
-            self.log += f'{action}\n'
+            action = yield
+            self.record(action)
             if action == "exit":
                 text_menu = "Bye bye!\n"
-                self.log += text_menu
-                print(text_menu, end="")
+                self.say(text_menu)
                 if self.exp_file:
-                    actions["export"]()
+                    yield from actions["export"]()
                 break
-            try:
-                actions[action]()  # call function
-            except KeyError:
-                print("Not a valid option.")
+            if action not in actions:
+                self.io.write("Not a valid option.\n")
+                continue
+            step = actions[action]()  # call function
+            if step is not None:
+                yield from step
+
+
+class StudySession(FlashCard):
+    # a learner connected to the server, the deck is shared so it can only be studied
+    menu_text = "Input the action (ask, exit, hardest card, top cards, reset stats):\n"
+
+    def __init__(self, deck, log=None):
+        super().__init__("", "", log=log or RingLog(SESSION_LOG_LINES))
+        self.cards = SessionCards(deck)
+
+    def actions(self):
+        return {"ask": self.ask, "hardest card": self.hardest_card, "top cards": self.top_cards,
+                "reset stats": self.reset}
+
+
+class SocketIO:
+
+    def __init__(self, writer):
+        self.writer = writer
+
+    def write(self, text):
+        self.writer.write(text.encode())
+
+
+async def serve_session(deck, reader, writer):
+    session = StudySession(deck)
+    session.io = SocketIO(writer)
+    steps = session.menu()
+    try:
+        next(steps)
+        while True:
+            await writer.drain()
+            line = await reader.readline()
+            if not line:
+                break
+            steps.send(line.decode().rstrip("\r\n"))
+    except StopIteration:
+        pass
+    except (ValueError, ConnectionError) as error:
+        session.say(f"Session closed: {error}\n")
+    finally:
+        steps.close()
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+
+async def start_server(deck, address):
+    # address is "host:port" for TCP or a path for a Unix socket
+    def handle(reader, writer):
+        return serve_session(deck, reader, writer)
+
+    host, _, port = address.rpartition(":")
+    if port.isdigit():
+        return await asyncio.start_server(handle, host or None, int(port), backlog=4096)
+    return await asyncio.start_unix_server(handle, address, backlog=4096)
+
+
+async def serve(deck, address):
+    server = await start_server(deck, address)
+    async with server:
+        await server.serve_forever()
 
 
 if __name__ == '__main__':
@@ -259,7 +1096,39 @@ if __name__ == '__main__':
                                                  "can help. ")
     parser.add_argument("-imp", "--import_from", default="")
     parser.add_argument("-exp", "--export_to", default="")
+    parser.add_argument("--progress", action="store_true", help="report import/export progress on stderr")
+    parser.add_argument("--log-file", default="", help="stream the session log to this file")
+    parser.add_argument("--log-lines", type=int, default=0, help="keep only the last N lines of the session log")
+    parser.add_argument("--fuzzy", type=int, nargs="?", const=0,
+                        help="accept answers that differ in case, accents or spacing, "
+                             "and with N also in up to N typos")
+    parser.add_argument("--serve", default="", metavar="ADDRESS",
+                        help="serve the imported deck to many learners on HOST:PORT or a Unix socket path")
+    parser.add_argument("--script", default="", help="read the session from this file ('-' for stdin), "
+                                                     "output is written in large buffered blocks")
     args = parser.parse_args()
 
-    my_cards = FlashCard(args.import_from, args.export_to)
-    my_cards.start_menu()
+    if args.log_file:
+        session_log = FileLog(args.log_file)
+    elif args.log_lines:
+        session_log = RingLog(args.log_lines)
+    else:
+        session_log = MemoryLog()
+
+    my_cards = FlashCard(args.import_from, args.export_to, print_progress if args.progress else None, session_log,
+                         args.fuzzy)
+    try:
+        if args.serve:
+            shared_deck = CardStore()
+            shared_deck.fuzzy = args.fuzzy
+            if args.import_from:
+                shared_deck.load(args.import_from)
+            asyncio.run(serve(shared_deck, args.serve))
+        elif args.script:
+            script = sys.stdin if args.script == "-" else open(args.script, "r", buffering=BUFFER_SIZE)
+            with script, open(sys.stdout.fileno(), "w", buffering=BUFFER_SIZE, closefd=False) as output:
+                my_cards.run(StreamIO(script, output))
+        else:
+            my_cards.start_menu()
+    finally:
+        session_log.close()
@@ -1,3 +1,1070 @@
+import argparse
+import functools
+import os
+import struct
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+# knight moves as (x, y) steps, in the order the original solver tried them
+KNIGHT_MOVES = [(1, 2), (2, 1), (-1, 2), (2, -1), (1, -2), (-2, 1), (-1, -2), (-2, -1)]
+KNIGHT_CODES = {move: code for code, move in enumerate(KNIGHT_MOVES)}
+
+# header of a path file: magic, format version, board dimensions, first square, number of squares, closed flag
+PATH_HEADER = struct.Struct("<4sBIIIIQ?")
+PATH_MAGIC = b"KNTP"
+PATH_VERSION = 1
+
+# header of a solvability map: magic, format version, board dimensions
+MAP_HEADER = struct.Struct("<4sBII")
+MAP_MAGIC = b"KNTM"
+MAP_VERSION = 1
+# solvability map entries, by starting square
+NO_TOUR, TOUR, UNDECIDED, NOT_ASKED = 0, 1, 2, 3
+MAP_SYMBOLS = ".T? "
+# visited flags of a KnightBoard row as the marks of their cells
+VISITED_MARKS = bytes.maketrans(b"\x00\x01", b"_*")
+
+CACHE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "knights_tour.cache")
+# the eight rotations and reflections of a board, as (swap, flip_x, flip_y)
+SYMMETRIES = [(swap, flip_x, flip_y) for swap in (False, True) for flip_x in (False, True) for flip_y in (False, True)]
+
+
+class KnightBoard:
+    """
+    Solver state for the knight's tour, kept in flat integer arrays.
+
+    The board is padded with a two-square border of visited squares, so the landing squares
+    of a knight are found by adding fixed offsets to its index, without range checks.
+    degree[i] holds the number of unvisited squares a knight on square i can move to, and is
+    updated when a square is visited.
+    """
+
+    def __init__(self, x_dim, y_dim):
+        self.x_dim = x_dim
+        self.y_dim = y_dim
+        self.width = x_dim + 4
+        self.offsets = [dy * self.width + dx for dx, dy in KNIGHT_MOVES]
+        size = self.width * (y_dim + 4)
+        self.visited = bytearray([1]) * size
+        # border squares are never read, 8 keeps their counts from going below zero
+        self.degree = bytearray([8]) * size
+
+        # at most 5 different rows of degrees, from the top and bottom two rows and the middle
+        row_degrees = {}
+        for y in range(1, y_dim + 1):
+            key = tuple(1 <= y + dy <= y_dim for _, dy in KNIGHT_MOVES)
+            if key not in row_degrees:
+                row_degrees[key] = bytes(sum(1 for (dx, _), inside in zip(KNIGHT_MOVES, key)
+                                             if inside and 1 <= x + dx <= x_dim) for x in range(1, x_dim + 1))
+            start = self.index(1, y)
+            self.visited[start:start + x_dim] = bytes(x_dim)
+            self.degree[start:start + x_dim] = row_degrees[key]
+        self.start_visited = bytes(self.visited)
+        self.start_degree = bytes(self.degree)
+        self.nodes = 0  # squares entered by the backtracking search
+        self.exhausted = False  # whether the last search ran out of its budget
+        self.walked = 0  # squares reached by the last walk
+
+    def reset(self):
+        """
+        Clear every visited square.
+        """
+        self.visited[:] = self.start_visited
+        self.degree[:] = self.start_degree
+
+    def index(self, x, y):
+        """
+        Return the array index of a square.
+
+        :param x: integer indicating the column, from 1
+        :param y: integer indicating the row, from 1
+        :return: integer index into visited and degree
+        """
+        return (y + 1) * self.width + x + 1
+
+    def position(self, index):
+        """
+        Return the square at an array index.
+
+        :param index: integer index into visited and degree
+        :return: tuple with integer values x, y
+        """
+        y, x = divmod(index, self.width)
+        return x - 1, y - 1
+
+    def distance(self, index):
+        """
+        Return how far a square is from the centre of the board.
+
+        :param index: integer index of the square
+        :return: integer, four times the squared distance
+        """
+        y, x = divmod(index, self.width)
+        return (2 * x - self.x_dim - 3) ** 2 + (2 * y - self.y_dim - 3) ** 2
+
+    def visit(self, index):
+        """
+        Mark a square as visited and update the degrees of the squares around it.
+
+        :param index: integer index of the square
+        """
+        self.visited[index] = 1
+        degree = self.degree
+        for offset in self.offsets:
+            degree[index + offset] -= 1
+
+    def leave(self, index):
+        """
+        Mark a visited square as unvisited again and update the degrees of the squares around it.
+
+        :param index: integer index of the square
+        """
+        self.visited[index] = 0
+        degree = self.degree
+        for offset in self.offsets:
+            degree[index + offset] += 1
+
+    def moves(self, index):
+        """
+        Return the unvisited squares a knight can move to.
+
+        :param index: integer index of the knight's square
+        :return: list of integer indexes, in KNIGHT_MOVES order
+        """
+        visited = self.visited
+        return [index + offset for offset in self.offsets if not visited[index + offset]]
+
+    def walk(self, start):
+        """
+        Walk the knight by Warnsdorff's rule with tie-breaking until it has no move left.
+
+        Of the squares with the fewest onward moves, the knight takes the one farthest
+        from the centre of the board (Roth's rule), which on its own completes the tour
+        on most boards, up to 1000x1000 and beyond.
+
+        :param start: integer index of the starting square
+        :return: array with the index of every square visited, in order
+        """
+        visited, degree, offsets = self.visited, self.degree, self.offsets
+        path = array("l", [start])
+        self.visit(start)
+        index = start
+        for _ in range(self.x_dim * self.y_dim - 1):
+            best, best_degree, ties = -1, 9, None
+            for offset in offsets:
+                landing = index + offset
+                if not visited[landing]:
+                    if degree[landing] < best_degree:
+                        best, best_degree, ties = landing, degree[landing], None
+                    elif degree[landing] == best_degree:
+                        if ties is None:
+                            ties = [best]
+                        ties.append(landing)
+            if best < 0:
+                break
+            if ties:
+                best = max(ties, key=self.distance)
+            index = best
+            path.append(index)
+            visited[index] = 1
+            for offset in offsets:
+                degree[index + offset] -= 1
+        return path
+
+    def backtrack(self, start, max_nodes=None, seconds=None, end=None):
+        """
+        Search every tour from a square, depth first with an explicit stack.
+
+        Moves are tried in Warnsdorff order, ties in KNIGHT_MOVES order from the last. A branch
+        is cut as soon as an unvisited square can no longer be reached, or two squares have a
+        single way in left, as both would have to be the last square of the tour.
+
+        :param start: integer index of the starting square
+        :param max_nodes: integer limit of squares entered, None for no limit
+        :param seconds: float limit of the search time, None for no limit
+        :param end: integer index the tour has to end on, None for any square; a tour ending a knight
+        move away from its start closes into a cycle
+        :return: array with the index of every square in tour order, or None if no tour was found,
+        in which case self.exhausted tells whether the budget ran out before the search did
+        """
+        visited, degree, offsets = self.visited, self.degree, self.offsets
+        total = self.x_dim * self.y_dim
+        deadline = time.perf_counter() + seconds if seconds is not None else None
+        self.nodes = 0
+        self.exhausted = False
+
+        # unvisited squares with no unvisited neighbour, and with only one
+        zeros = ones = 0
+        for y in range(1, self.y_dim + 1):
+            row = self.index(1, y)
+            zeros += self.degree[row:row + self.x_dim].count(0)
+            ones += self.degree[row:row + self.x_dim].count(1)
+
+        path = array("l")
+        choices = [[start]]
+        while choices:
+            if not choices[-1]:
+                # every move from here failed, take the last square back
+                choices.pop()
+                if not path:
+                    break
+                index = path.pop()
+                for offset in offsets:
+                    landing = index + offset
+                    degree[landing] += 1
+                    if not visited[landing]:
+                        if degree[landing] == 1:
+                            zeros -= 1
+                            ones += 1
+                        elif degree[landing] == 2:
+                            ones -= 1
+                visited[index] = 0
+                if degree[index] == 0:
+                    zeros += 1
+                elif degree[index] == 1:
+                    ones += 1
+                continue
+
+            index = choices[-1].pop()
+            self.nodes += 1
+            if max_nodes is not None and self.nodes > max_nodes or \
+                    deadline is not None and self.nodes & 4095 == 0 and time.perf_counter() > deadline:
+                self.exhausted = True
+                return None
+
+            path.append(index)
+            visited[index] = 1
+            if degree[index] == 0:
+                zeros -= 1
+            elif degree[index] == 1:
+                ones -= 1
+            for offset in offsets:
+                landing = index + offset
+                degree[landing] -= 1
+                if not visited[landing]:
+                    if degree[landing] == 0:
+                        ones -= 1
+                        zeros += 1
+                    elif degree[landing] == 1:
+                        ones += 1
+            if len(path) == total:
+                return path
+
+            moves = self.moves(index)
+            dead_ends = sum(1 for landing in moves if degree[landing] == 1)
+            ends = 1
+            if end is not None:
+                # the end square is kept for last, no other square may be left with a single way in
+                if len(path) < total - 1 and end in moves:
+                    moves.remove(end)
+                    dead_ends -= degree[end] == 1
+                ends = 1 if degree[end] == 1 and end not in moves else 0
+            if zeros and len(path) < total - 1 or ones - dead_ends > ends:
+                moves = []
+            # fewest onward moves last, as it is the first taken off the list
+            moves.sort(key=degree.__getitem__, reverse=True)
+            choices.append(moves)
+        return None
+
+    def solve(self, start, max_nodes=None, seconds=None):
+        """
+        Find a knight's tour, by a tie-breaking Warnsdorff walk or else by backtracking.
+
+        :param start: integer index of the starting square
+        :param max_nodes: integer limit of squares entered by the backtracking, None for no limit
+        :param seconds: float limit of the backtracking time, None for no limit
+        :return: array with the index of every square in tour order, or None
+        """
+        self.nodes = 0
+        self.exhausted = False
+        self.walked = 0
+        x, y = self.position(start)
+        if self.x_dim * self.y_dim % 2 and (x + y) % 2:
+            # the knight changes colour every move, so with an odd number of squares
+            # the tour has to start and end on the colour of the corners
+            return None
+        path = self.walk(start)
+        self.walked = len(path)
+        if len(path) == self.x_dim * self.y_dim:
+            return path
+        self.reset()
+        return self.backtrack(start, max_nodes, seconds)
+
+
+@functools.lru_cache(maxsize=8)
+def shared_board(x_dim, y_dim):
+    # one per board size in each process, so the tables are only built once; reset before use
+    return KnightBoard(x_dim, y_dim)
+
+
+def closed_block(task):
+    """
+    Find a closed tour of a block that goes over a given move.
+
+    :param task: tuple with the block width and height and the two squares of the move,
+    each a tuple of integer values column, row counted from 0 at the bottom left
+    :return: tuple with the squares of the block in tour order, the move joining the last to the first
+    """
+    width, height, first, last = task
+    knight_board = KnightBoard(width, height)
+    path = knight_board.backtrack(knight_board.index(first[0] + 1, first[1] + 1), None, None,
+                                  knight_board.index(last[0] + 1, last[1] + 1))
+    if path is None:
+        raise ValueError(f"no closed tour of a {width}x{height} block goes over {first}-{last}")
+    return tuple((x - 1, y - 1) for x, y in map(knight_board.position, path))
+
+
+def split_side(length):
+    """
+    Split a side of the board into the sides of the blocks.
+
+    :param length: integer side of the board, at least 6
+    :return: list of integer sides from 6 to 11, with at most one odd one
+    """
+    if length % 2:
+        if length <= 11:
+            return [length]
+        return [7] + split_side(length - 7)
+    sides = []
+    while length > 10:
+        sides.append(8 if length - 8 >= 6 else 6)
+        length -= sides[-1]
+    sides.append(length)
+    return sides
+
+
+class BlockTour:
+    """
+    Closed knight's tours of large boards by divide and conquer, after Parberry.
+
+    The board is cut into a grid of blocks with sides from 6 to 11, and each kind of block is
+    given a closed tour once, by backtracking, in a process pool. The blocks of each row are
+    joined left to right, and the rows top to bottom along the first column: at a join one move
+    near a corner of each block is swapped for two moves across the border, which merges the two
+    cycles into one. The tour is never held whole, squares() walks the tree of joins and yields
+    every square as it comes to it.
+
+    Corner squares only have two moves, so every closed tour of a block goes over the moves
+    (w-1, 0)-(w-2, 2) at its bottom right and (0, h-1)-(2, h-2) at its top left. The moves at
+    the bottom left are not given, and are asked of the block tours: (1, 1)-(0, 3) for blocks
+    joined to a block on their left, (1, 1)-(3, 0) for the first column, joined to the row below.
+    """
+
+    def __init__(self, x_dim, y_dim, workers=1):
+        if not self.fits(x_dim, y_dim):
+            raise ValueError(f"no block tour of a {x_dim}x{y_dim} board")
+        self.x_dim = x_dim
+        self.y_dim = y_dim
+        self.workers = workers
+        self.columns = split_side(x_dim)
+        self.rows = split_side(y_dim)  # from the top
+        self.blocks = {}
+
+    @staticmethod
+    def fits(x_dim, y_dim):
+        """
+        Check whether a board can be cut into blocks with closed tours.
+
+        :param x_dim: integer indicating the number of columns
+        :param y_dim: integer indicating the number of rows
+        :return: boolean, both sides at least 6 and an even number of squares
+        """
+        return min(x_dim, y_dim) >= 6 and x_dim * y_dim % 2 == 0
+
+    def solve_blocks(self):
+        """
+        Find a closed tour for every kind of block on the board, in a process pool if self.workers > 1.
+        """
+        tasks = sorted({(width, height, (1, 1), (3, 0) if i == 0 else (0, 3))
+                        for i, width in enumerate(self.columns) for height in self.rows} - set(self.blocks))
+        if self.workers > 1 and len(tasks) > 1:
+            with ProcessPoolExecutor(self.workers) as pool:
+                tours = list(pool.map(closed_block, tasks))
+        else:
+            tours = list(map(closed_block, tasks))
+        self.blocks.update(zip(tasks, tours))
+
+    def block(self, column, row):
+        """
+        Return what a block needs to be walked.
+
+        :param column: integer index of the block in self.columns
+        :param row: integer index of the block in self.rows, from the top
+        :return: tuple with the block tour and the x, y of its bottom left square on the board
+        """
+        width, height = self.columns[column], self.rows[row]
+        tour = self.blocks[width, height, (1, 1), (3, 0) if column == 0 else (0, 3)]
+        return tour, sum(self.columns[:column]) + 1, self.y_dim - sum(self.rows[:row + 1]) + 1
+
+    def joins(self, column, row):
+        """
+        Return the joins from a block to the blocks walked from it.
+
+        :param column: integer index of the block in self.columns
+        :param row: integer index of the block in self.rows, from the top
+        :return: dictionary from each square of a cut move to the other square of the move,
+        the next block and the squares of that block the two are joined to
+        """
+        width, height = self.columns[column], self.rows[row]
+        joins = {}
+        if column + 1 < len(self.columns):
+            # the bottom right corner to the bottom left of the block on the right
+            a, b = (width - 1, 0), (width - 2, 2)
+            joins[a] = b, (column + 1, row), (1, 1), (0, 3)
+            joins[b] = a, (column + 1, row), (0, 3), (1, 1)
+        if column == 0 and row + 1 < len(self.rows):
+            # the bottom left corner to the top left of the block below
+            below = self.rows[row + 1]
+            a, b = (1, 1), (3, 0)
+            joins[a] = b, (0, row + 1), (0, below - 1), (2, below - 2)
+            joins[b] = a, (0, row + 1), (2, below - 2), (0, below - 1)
+        return joins
+
+    def walk(self):
+        """
+        Yield every square of the tour, from the top left block.
+
+        A block is walked round its tour from the square it is entered on, away from the square
+        it has to be left from. Where the next move of the tour is a cut one, the joined block
+        is walked first, and the walk goes on after it, so the blocks form a stack.
+        """
+        if not self.blocks:
+            self.solve_blocks()
+        tour, x0, y0 = self.block(0, 0)
+        joins = self.joins(0, 0)
+        # the move back to the first square is the one left out, it must not be a cut one
+        first = next(i for i in range(len(tour)) if joins.get(tour[i - 1], (None,))[0] != tour[i])
+        # block tour, position, direction, squares left, joins and offsets of every block being walked
+        stack = [[tour, first, 1, len(tour), joins, x0, y0]]
+        while stack:
+            frame = stack[-1]
+            tour, position, direction, left, joins, x0, y0 = frame
+            square = tour[position]
+            yield square[0] + x0, square[1] + y0
+            left -= 1
+            if not left:
+                stack.pop()
+                continue
+            position = (position + direction) % len(tour)
+            frame[1], frame[3] = position, left
+            join = joins.get(square)
+            if join is not None and tour[position] == join[0]:
+                (column, row), entry, exit = join[1], join[2], join[3]
+                block_tour, x0, y0 = self.block(column, row)
+                entered = block_tour.index(entry)
+                step = -1 if block_tour[(entered + 1) % len(block_tour)] == exit else 1
+                stack.append([block_tour, entered, step, len(block_tour), self.joins(column, row), x0, y0])
+
+    def squares(self, start=None):
+        """
+        Yield every square of the closed tour in order.
+
+        :param start: tuple with integer values x, y of the first square, None for the top left block
+        :return: generator of tuples with integer values x, y
+        """
+        if start is None:
+            yield from self.walk()
+            return
+        # the tour is a cycle, so it is walked twice rather than kept: from the start to the end, then up to the start
+        turn = next(i for i, square in enumerate(self.walk()) if square == start)
+        yield from islice(self.walk(), turn, None)
+        yield from islice(self.walk(), turn)
+
+
+def write_path(file_name, x_dim, y_dim, squares, closed=False):
+    """
+    Write a tour to a path file, as it is yielded.
+
+    The file holds a header and then a 4-bit KNIGHT_MOVES code for every move, two to a byte.
+
+    :param file_name: string with the name of the file
+    :param x_dim: integer indicating the number of columns
+    :param y_dim: integer indicating the number of rows
+    :param squares: iterable of tuples with integer values x, y in tour order
+    :param closed: boolean, whether the last square is a knight move from the first
+    :return: integer number of squares written
+    """
+    squares = iter(squares)
+    first = next(squares)
+    count, pending = 1, None
+    buffer = bytearray()
+    with open(file_name, "wb") as file:
+        file.write(PATH_HEADER.pack(PATH_MAGIC, PATH_VERSION, x_dim, y_dim, *first, 0, closed))
+        x, y = first
+        for next_x, next_y in squares:
+            code = KNIGHT_CODES[next_x - x, next_y - y]
+            x, y = next_x, next_y
+            count += 1
+            if pending is None:
+                pending = code
+            else:
+                buffer.append(pending | code << 4)
+                pending = None
+                if len(buffer) >= 1 << 16:
+                    file.write(buffer)
+                    buffer.clear()
+        if pending is not None:
+            buffer.append(pending)
+        file.write(buffer)
+        # the number of squares is only known at the end
+        file.seek(0)
+        file.write(PATH_HEADER.pack(PATH_MAGIC, PATH_VERSION, x_dim, y_dim, *first, count, closed))
+    return count
+
+
+def read_path(file_name):
+    """
+    Read a tour from a path file.
+
+    :param file_name: string with the name of the file
+    :return: tuple with integer values x_dim, y_dim, boolean closed and a generator of
+    tuples with integer values x, y in tour order
+    """
+    with open(file_name, "rb") as file:
+        magic, version, x_dim, y_dim, x, y, count, closed = PATH_HEADER.unpack(file.read(PATH_HEADER.size))
+        if magic != PATH_MAGIC or version != PATH_VERSION:
+            raise ValueError(f"{file_name} is not a knight's tour path file")
+        codes = file.read()
+
+    def squares():
+        if not count:
+            return
+        square_x, square_y = x, y
+        yield square_x, square_y
+        for i in range(count - 1):
+            dx, dy = KNIGHT_MOVES[codes[i >> 1] >> 4 * (i & 1) & 15]
+            square_x += dx
+            square_y += dy
+            yield square_x, square_y
+
+    return x_dim, y_dim, closed, squares()
+
+
+def transform(symmetry, x_dim, y_dim, x, y):
+    """
+    Map a square to its place on the board turned by a symmetry.
+
+    :param symmetry: tuple of booleans swap, flip_x, flip_y from SYMMETRIES; the axes are
+    swapped first, then the columns and the rows are mirrored
+    :param x_dim: integer indicating the number of columns
+    :param y_dim: integer indicating the number of rows
+    :param x: integer indicating the column, from 1
+    :param y: integer indicating the row, from 1
+    :return: tuple with integer values x_dim, y_dim, x, y of the turned board
+    """
+    swap, flip_x, flip_y = symmetry
+    if swap:
+        x_dim, y_dim, x, y = y_dim, x_dim, y, x
+    if flip_x:
+        x = x_dim + 1 - x
+    if flip_y:
+        y = y_dim + 1 - y
+    return x_dim, y_dim, x, y
+
+
+def inverse(symmetry):
+    """
+    Return the symmetry that turns a board back.
+
+    :param symmetry: tuple of booleans swap, flip_x, flip_y from SYMMETRIES
+    :return: tuple of booleans swap, flip_x, flip_y
+    """
+    swap, flip_x, flip_y = symmetry
+    return (swap, flip_y, flip_x) if swap else symmetry
+
+
+class SolutionCache:
+    """
+    Tours found by Puzzle.find_solution, kept on disk from one run to the next.
+
+    A board and starting square are looked up in the form that is smallest over the eight
+    rotations and reflections, so the tour from a corner serves all four corners, and a 5x8
+    board serves the 8x5 one. Every entry is a path file of that form in the cache directory,
+    with no moves when no tour exists. The least recently used entries are deleted beyond
+    max_entries files or max_bytes on disk.
+    """
+
+    def __init__(self, path=CACHE_PATH, max_entries=10_000, max_bytes=64 * 2 ** 20):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = None  # file size by file name, least recently used first
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def load(self):
+        """
+        Read the entries of the cache directory, in the order they were last used.
+        """
+        os.makedirs(self.path, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(".ktp") and entry.is_file():
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name, stat.st_size))
+        self.entries = OrderedDict((name, size) for _, name, size in sorted(files))
+        self.size = sum(self.entries.values())
+
+    @staticmethod
+    def key(x_dim, y_dim, start):
+        """
+        Return the smallest form of a board and starting square.
+
+        :param x_dim: integer indicating the number of columns
+        :param y_dim: integer indicating the number of rows
+        :param start: tuple with integer values x, y of the starting square
+        :return: tuple with the file name of the entry and the symmetry that gives it
+        """
+        turned, symmetry = min((transform(symmetry, x_dim, y_dim, *start), symmetry) for symmetry in SYMMETRIES)
+        return "{}x{}-{}-{}.ktp".format(*turned), symmetry
+
+    def get(self, x_dim, y_dim, start):
+        """
+        Look up the tour from a square.
+
+        :param x_dim: integer indicating the number of columns
+        :param y_dim: integer indicating the number of rows
+        :param start: tuple with integer values x, y of the starting square
+        :return: tuple with boolean found and the list of tuples with integer values x, y of the
+        tour, None if no tour exists
+        """
+        if self.entries is None:
+            self.load()
+        name, symmetry = self.key(x_dim, y_dim, start)
+        if name not in self.entries:
+            self.misses += 1
+            return False, None
+        file_name = os.path.join(self.path, name)
+        try:
+            turned_x, turned_y, _, squares = read_path(file_name)
+            back = inverse(symmetry)
+            path = [transform(back, turned_x, turned_y, x, y)[2:] for x, y in squares]
+            os.utime(file_name)
+        except (OSError, ValueError, struct.error):
+            # deleted or broken under us, it is searched again
+            self.size -= self.entries.pop(name)
+            self.misses += 1
+            return False, None
+        self.entries.move_to_end(name)
+        self.hits += 1
+        return True, path or None
+
+    def put(self, x_dim, y_dim, start, path):
+        """
+        Store the tour from a square.
+
+        :param x_dim: integer indicating the number of columns
+        :param y_dim: integer indicating the number of rows
+        :param start: tuple with integer values x, y of the starting square
+        :param path: iterable of tuples with integer values x, y in tour order, None if no tour exists
+        """
+        if self.entries is None:
+            self.load()
+        name, symmetry = self.key(x_dim, y_dim, start)
+        file_name = os.path.join(self.path, name)
+        temp_name = f"{file_name}.tmp"
+        turned_x, turned_y = transform(symmetry, x_dim, y_dim, 1, 1)[:2]
+        if path is None:
+            with open(temp_name, "wb") as file:
+                file.write(PATH_HEADER.pack(PATH_MAGIC, PATH_VERSION, turned_x, turned_y,
+                                            *transform(symmetry, x_dim, y_dim, *start)[2:], 0, False))
+        else:
+            write_path(temp_name, turned_x, turned_y, (transform(symmetry, x_dim, y_dim, x, y)[2:] for x, y in path))
+        os.replace(temp_name, file_name)
+
+        self.size -= self.entries.pop(name, 0)
+        self.entries[name] = os.path.getsize(file_name)
+        self.size += self.entries[name]
+        while len(self.entries) > 1 and (len(self.entries) > self.max_entries or self.size > self.max_bytes):
+            old_name, old_size = self.entries.popitem(last=False)
+            self.size -= old_size
+            try:
+                os.remove(os.path.join(self.path, old_name))
+            except FileNotFoundError:
+                pass
+
+
+class TourCounter:
+    """
+    Exact search of every knight's tour of a small board, with bitmasks.
+
+    Square (x, y) is bit (y - 1) * x_dim + x - 1 of the sets of squares. A branch is cut as soon
+    as an unvisited square has no way in left, or two squares could only be the last one of the
+    tour; for a closed tour, that square also has to be a knight move from the start. Only the
+    squares around the knight's last two squares can change, so only they are looked at.
+    Counts of the ways to finish from a square over a set of unvisited squares are kept for sets
+    of up to memo_limit squares, as many branches run into the same ones.
+
+    Tours are counted as paths from their start, so every closed tour is counted both ways round.
+    """
+
+    def __init__(self, x_dim, y_dim, memo_limit=16, memo_size=1_000_000):
+        self.x_dim = x_dim
+        self.y_dim = y_dim
+        self.full = (1 << x_dim * y_dim) - 1
+        self.neighbours = []  # set of the squares a knight can move to, by square
+        self.moves = []  # list of those squares with their bits, by square
+        for square in range(x_dim * y_dim):
+            y, x = divmod(square, x_dim)
+            moves = [(y + dy) * x_dim + x + dx for dx, dy in KNIGHT_MOVES
+                     if 0 <= x + dx < x_dim and 0 <= y + dy < y_dim]
+            self.neighbours.append(sum(1 << move for move in moves))
+            self.moves.append([(move, 1 << move) for move in moves])
+        self.memo_limit = memo_limit
+        self.memo_size = memo_size
+        self.memo = {}
+        self.nodes = 0  # squares entered by the searches
+
+    def square(self, x, y):
+        """
+        Return the bit number of a square.
+
+        :param x: integer indicating the column, from 1
+        :param y: integer indicating the row, from 1
+        :return: integer square number
+        """
+        return (y - 1) * self.x_dim + x - 1
+
+    def position(self, square):
+        """
+        Return the square of a bit number.
+
+        :param square: integer square number
+        :return: tuple with integer values x, y
+        """
+        y, x = divmod(square, self.x_dim)
+        return x + 1, y + 1
+
+    def connected(self, free):
+        """
+        Check whether a knight can get from every square of a set to every other one within it.
+
+        :param free: integer set of squares
+        :return: boolean
+        """
+        neighbours = self.neighbours
+        reached = free & -free
+        while True:
+            grown, edge = reached, reached
+            while edge:
+                bit = edge & -edge
+                edge ^= bit
+                grown |= neighbours[bit.bit_length() - 1]
+            grown &= free
+            if grown == reached:
+                return reached == free
+            reached = grown
+
+    def step(self, square, move, free, ends, last):
+        """
+        Move the knight and check the squares left.
+
+        :param square: integer square of the knight
+        :param move: integer square it moves to, in free
+        :param free: integer set of the unvisited squares
+        :param ends: integer set of the unvisited squares that could only be the last one
+        :param last: integer set of the squares the tour may end on
+        :return: tuple with the integer sets free and ends after the move, or None if no tour is left
+        """
+        neighbours = self.neighbours
+        free ^= 1 << move
+        onward = neighbours[move]
+        # squares that lost a way in, or that the knight is no longer next to
+        changed = (onward | neighbours[square]) & free
+        ends &= free & ~changed
+        while changed:
+            bit = changed & -changed
+            changed ^= bit
+            ways = (neighbours[bit.bit_length() - 1] & free).bit_count()
+            if ways == 0 and not bit & onward:
+                return None
+            if ways == 0 or ways == 1 and not bit & onward:
+                ends |= bit
+        if ends & (ends - 1) or ends & ~last:
+            return None
+        return free, ends
+
+    def count(self, square, free, ends, last):
+        """
+        Count the ways to finish a tour.
+
+        :param square: integer square of the knight
+        :param free: integer set of the unvisited squares
+        :param ends: integer set of the unvisited squares that could only be the last one
+        :param last: integer set of the squares the tour may end on, -1 for any
+        :return: integer number of tours
+        """
+        self.nodes += 1
+        key = None
+        if free.bit_count() <= self.memo_limit:
+            key = square, free, last
+            total = self.memo.get(key)
+            if total is not None:
+                return total
+        total = 0
+        for move, bit in self.moves[square]:
+            if free & bit:
+                if free == bit:
+                    total += 1 if bit & last else 0
+                    continue
+                after = self.step(square, move, free, ends, last)
+                if after is not None:
+                    total += self.count(move, after[0], after[1], last)
+        if key is not None:
+            if len(self.memo) >= self.memo_size:
+                self.memo.clear()
+            self.memo[key] = total
+        return total
+
+    def tours(self, path, free, ends, last):
+        """
+        Yield every way to finish a tour.
+
+        :param path: list of the integer squares visited, the knight on the last one
+        :param free: integer set of the unvisited squares
+        :param ends: integer set of the unvisited squares that could only be the last one
+        :param last: integer set of the squares the tour may end on, -1 for any
+        :return: generator of lists of integer squares, in tour order
+        """
+        self.nodes += 1
+        square = path[-1]
+        for move, bit in self.moves[square]:
+            if free & bit:
+                if free == bit:
+                    if bit & last:
+                        yield path + [move]
+                    continue
+                after = self.step(square, move, free, ends, last)
+                if after is not None:
+                    path.append(move)
+                    yield from self.tours(path, after[0], after[1], last)
+                    path.pop()
+
+    def prefixes(self, start, closed=False, plies=3):
+        """
+        Return the first moves of every tour, to be searched apart.
+
+        Sets that fall apart are only looked for here: deeper in the search the check costs
+        more than the branches it cuts.
+
+        :param start: integer starting square
+        :param closed: boolean, whether only closed tours are searched
+        :param plies: integer number of moves
+        :return: list of tuples with the path, free, ends and last of each branch
+        """
+        last = self.neighbours[start] if closed else -1
+        branches = [([start], self.full ^ 1 << start, 0)]
+        for _ in range(plies):
+            grown = []
+            for path, free, ends in branches:
+                for move, bit in self.moves[path[-1]]:
+                    if free & bit and free != bit:
+                        after = self.step(path[-1], move, free, ends, last)
+                        if after is not None and self.connected(after[0]):
+                            grown.append((path + [move], after[0], after[1]))
+                    elif free == bit and bit & last:
+                        grown.append((path + [move], 0, 0))
+            branches = grown
+        return [(path, free, ends, last) for path, free, ends in branches]
+
+
+@functools.lru_cache(maxsize=None)
+def tour_counter(x_dim, y_dim):
+    # one per board in each process, so its memo is kept from one branch to the next
+    return TourCounter(x_dim, y_dim)
+
+
+def count_branch(task):
+    """
+    Count the tours of a branch, in a worker process.
+
+    :param task: tuple with x_dim, y_dim and a branch from TourCounter.prefixes
+    :return: tuple with integer number of tours and integer squares entered
+    """
+    x_dim, y_dim, (path, free, ends, last) = task
+    counter = tour_counter(x_dim, y_dim)
+    nodes = counter.nodes
+    total = counter.count(path[-1], free, ends, last) if free else 1
+    return total, counter.nodes - nodes
+
+
+def list_branch(task):
+    """
+    List the tours of a branch, in a worker process.
+
+    :param task: tuple with x_dim, y_dim and a branch from TourCounter.prefixes
+    :return: tuple with a list of the tours, each a list of tuples with integer values x, y,
+    and integer squares entered
+    """
+    x_dim, y_dim, (path, free, ends, last) = task
+    counter = tour_counter(x_dim, y_dim)
+    nodes = counter.nodes
+    tours = counter.tours(path, free, ends, last) if free else [path]
+    return [list(map(counter.position, tour)) for tour in tours], counter.nodes - nodes
+
+
+def count_tours(x_dim, y_dim, start, closed=False, workers=1, plies=3):
+    """
+    Count every knight's tour from a square.
+
+    :param x_dim: integer indicating the number of columns
+    :param y_dim: integer indicating the number of rows
+    :param start: tuple with integer values x, y of the starting square
+    :param closed: boolean, whether only closed tours are counted
+    :param workers: integer number of processes the branches are counted in
+    :param plies: integer number of moves the search is split at
+    :return: tuple with integer number of tours and integer squares entered
+    """
+    counter = tour_counter(x_dim, y_dim)
+    tasks = [(x_dim, y_dim, branch) for branch in counter.prefixes(counter.square(*start), closed, plies)]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(count_branch, tasks))
+    else:
+        results = list(map(count_branch, tasks))
+    return sum(total for total, _ in results), sum(nodes for _, nodes in results)
+
+
+def enumerate_tours(x_dim, y_dim, start, closed=False, workers=1, plies=3, stats=None):
+    """
+    Yield every knight's tour from a square, a branch at a time.
+
+    :param x_dim: integer indicating the number of columns
+    :param y_dim: integer indicating the number of rows
+    :param start: tuple with integer values x, y of the starting square
+    :param closed: boolean, whether only closed tours are listed
+    :param workers: integer number of processes the branches are searched in
+    :param plies: integer number of moves the search is split at
+    :param stats: list the squares entered are added to at index 0, or None
+    :return: generator of lists of tuples with integer values x, y, in tour order
+    """
+    counter = tour_counter(x_dim, y_dim)
+    tasks = [(x_dim, y_dim, branch) for branch in counter.prefixes(counter.square(*start), closed, plies)]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            results = pool.map(list_branch, tasks)
+            for tours, nodes in results:
+                if stats is not None:
+                    stats[0] += nodes
+                yield from tours
+    else:
+        for tours, nodes in map(list_branch, tasks):
+            if stats is not None:
+                stats[0] += nodes
+            yield from tours
+
+
+class BoardRenderer:
+    """
+    Text of a chessboard in the layout of Puzzle.draw_board, apart from what holds the cells.
+
+    Cells are asked for by square, so a frame can cover the whole board or only a window of it.
+    A frame is built and written at once; a numbered tour is written a row at a time, from an
+    array of the numbers instead of a string for every cell.
+    """
+
+    def __init__(self, x_dim, y_dim):
+        self.x_dim = x_dim
+        self.y_dim = y_dim
+        self.cell_size = len(str(x_dim))
+        self.empty = "_" * (self.cell_size + 1)
+
+    def border(self, columns):
+        """
+        Return the line above and below the board.
+
+        :param columns: integer number of columns drawn
+        :return: string
+        """
+        return f"{' ' * self.cell_size}{'-' * (columns * (self.cell_size + 2) + 3)}"
+
+    def labels(self, columns):
+        """
+        Return the line of column numbers under the board.
+
+        :param columns: range of the columns drawn
+        :return: string
+        """
+        return " " * (self.cell_size + 1) + "".join(f" {x:>{self.cell_size + 1}}" for x in columns)
+
+    def offset(self, x):
+        """
+        Return where the cell of a column starts in the line of a row.
+
+        :param x: integer indicating the column, from 1
+        :return: integer
+        """
+        return x * (self.cell_size + 2)
+
+    def row(self, y, cells):
+        """
+        Return the line of a row of the board.
+
+        :param y: integer indicating the row, from 1
+        :param cells: iterable of the strings of its cells, each cell_size + 1 long, or of runs of
+        cells already joined
+        :return: string
+        """
+        return f"{y:>{self.cell_size}}| {' '.join(cells)} |"
+
+    def window(self, x, y, radius):
+        """
+        Return the squares within a distance of a square, moved inwards at the edges so the
+        window keeps its size on boards large enough.
+
+        :param x: integer indicating the column, from 1
+        :param y: integer indicating the row, from 1
+        :param radius: integer number of squares drawn on each side
+        :return: tuple with the ranges of the columns and of the rows
+        """
+        def span(centre, length):
+            low = max(1, min(centre - radius, length - 2 * radius))
+            return range(low, min(length, low + 2 * radius) + 1)
+
+        return span(x, self.x_dim), span(y, self.y_dim)
+
+    def frame(self, cell, columns=None, rows=None):
+        """
+        Return the text of the board, or of a window of it.
+
+        :param cell: function of the x, y of a square returning the string of its cell
+        :param columns: range of the columns drawn, None for all of them
+        :param rows: range of the rows drawn, None for all of them
+        :return: string ending with a new line
+        """
+        columns = columns or range(1, self.x_dim + 1)
+        rows = rows or range(1, self.y_dim + 1)
+        lines = [self.border(len(columns))]
+        lines.extend(self.row(y, [cell(x, y) for x in columns]) for y in reversed(rows))
+        lines += [self.border(len(columns)), self.labels(columns), ""]
+        return "\n".join(lines)
+
+    def write_numbers(self, file, numbers):
+        """
+        Write a numbered board, a row at a time.
+
+        :param file: text file to write to
+        :param numbers: array of the number of every square, 0 for none, indexed by (y - 1) * x_dim + x - 1
+        """
+        width, empty = self.cell_size + 1, self.empty
+        # a full row is formatted in one go
+        numbered = " ".join([f"%{width}d"] * self.x_dim)
+        file.write(self.border(self.x_dim) + "\n")
+        for y in range(self.y_dim, 0, -1):
+            row = numbers[(y - 1) * self.x_dim:y * self.x_dim]
+            if 0 in row:
+                cells = " ".join([f"{number:>{width}}" if number else empty for number in row])
+            else:
+                cells = numbered % tuple(row)
+            file.write(f"{y:>{self.cell_size}}| {cells} |\n")
+        file.write(f"{self.border(self.x_dim)}\n{self.labels(range(1, self.x_dim + 1))}\n")
+
+
 class Puzzle:
     """The creation of the Puzzle object and the related functionality."""
 
@@ -7,27 +1074,42 @@ class Puzzle:
         self.y_dim = 4
         self.x_pos = 2
         self.y_pos = 2
-        self.board = []
         self.cell_size = None
-        self.initial_position = True
-        self.border_length = None
+        self.renderer = None  # BoardRenderer of the board, once setup_board has run
         self.border = None
-        self.row = None
         self.column_labels = None
+        self.knight_board = None  # KnightBoard of the game played by user_game
+        self.hints = []  # integer indexes of the squares the knight can move to
+        self.lines = None  # rows of the board as last drawn by draw_board
+        self.numbers = None  # array of the tour number of every square, once the solution is found
+        self.viewport = None  # squares drawn around the knight by draw_board, None for the whole board
+        self.undo_dead_end = False  # whether user_game offers to undo the last move at a dead end
+        self.changed_cells = set()  # squares marked by redraw_cell since then
         self.try_puzzle = True
-        self.solution_found = False
+        self.max_nodes = 1_000_000  # budget of the backtracking search
+        self.time_limit = None
+        self.nodes = 0  # squares entered by the last backtracking search
+        self.closed = False  # whether large boards are given a closed tour by BlockTour
+        self.workers = 1  # processes finding the BlockTour blocks
+        self.cache = None  # SolutionCache of the tours found, None to always search
+        self.exhausted = False  # whether the last search ran out of its budget
+        self.reached = 0  # squares of the tour, or of the walk when the last search found none
 
-    def check_dimensions(self, operation, message, error_message):
+    def check_dimensions(self, operation, message, error_message, commands=()):
         """
         Verify the input dimensions and the user's next move.
 
         :param operation: string indicating the operation, must be 'board', 'start_position' or 'move'
         :param message: string indicating the input message
         :param error_message: string indicating the error message for the exception
-        :return: tuple with integer values x, y
+        :param commands: strings accepted as they are instead of a square
+        :return: tuple with integer values x, y, or the command entered
         """
         while True:
-            dimensions = input(message).split()
+            answer = input(message)
+            if answer.strip() in commands:
+                return answer.strip()
+            dimensions = answer.split()
             try:
                 if len(dimensions) != 2:
                     raise ValueError
@@ -42,8 +1124,7 @@ class Puzzle:
                     if not 0 < x <= self.x_dim or not 0 < y <= self.y_dim:
                         raise ValueError
                     # Check for invalid move
-                    elif operation == "move" and (self.board[-y][x] == f"{' ' * self.cell_size}*" or
-                                                  self.board[-y][x] == f"{'_' * (self.cell_size + 1)}"):
+                    elif operation == "move" and not self.valid_move(x, y):
                         raise ValueError
                 return x, y
             except ValueError:
@@ -70,156 +1151,186 @@ class Puzzle:
                 break
             print("Invalid input!")
 
-        self.setup_board()
+        if self.try_puzzle:
+            # a solution is printed from self.numbers, without a string for every cell
+            self.setup_board()
 
     def setup_board(self):
         """
-        Create chessboard.
-        """
-        self.cell_size = len(str(self.x_dim))
-        self.border_length = self.x_dim * (self.cell_size + 2) + 3
-        self.border = f"{' ' * self.cell_size}{'-' * self.border_length}"  # ---------------
-        self.row = ["_" * (self.cell_size + 1)] * self.x_dim  # ['__', '__', '__', '__']
-        self.row.append("|")
-
-        # Create rows
-        for i in range(self.y_dim, 0, -1):
-            new_row = self.row[:]
-            new_row.insert(0, f"{' ' * (self.cell_size - len(str(i)))}{i}|")  # ' for example: 5|' or '10|'
-            self.board.append(new_row)  # # ['2|', '__', '__', '__', '__', '|']
+        Set up the drawing of the chessboard.
 
-        # Set starting position on board
-        self.board[-self.y_pos][self.x_pos] = f"{' ' * self.cell_size}X"  # ['2|', '__', ' X', '__', '__', '|']
-
-        # Column labels
-        self.column_labels = f"{' ' * (self.cell_size + 1)}"
-        for i in range(1, self.x_dim + 1):
-            self.column_labels += f" {' ' * ((self.cell_size + 1) - len(str(i)))}{i}"  # 1  2  3  4
-
-        self.initial_position = True
-
-    def print_board(self):
-        """
-        Print current state of the chessboard.
+        No string is kept for the cells, draw_board derives them from the game's KnightBoard.
         """
-        print(self.border)
-        for line in self.board:
-            print(" ".join(line))  # 2| __  X __ __ |
-        print(self.border)
-        print(self.column_labels)  # 1  2  3  4
+        self.renderer = BoardRenderer(self.x_dim, self.y_dim)
+        self.cell_size = self.renderer.cell_size
+        self.border = self.renderer.border(self.x_dim)
+        self.column_labels = self.renderer.labels(range(1, self.x_dim + 1))
+        self.lines = None
 
-    def possible_moves(self, x, y):
+    def print_solution(self, file=None):
         """
-        Return the number of possible moves
+        Print the numbered solution found by self.find_solution, a row at a time.
 
-        The knight moves in an L-shape, so it has to move 2 squares horizontally and 1 square vertically,
-        or 2 squares vertically and 1 square horizontally.
+        :param file: text file to write to, None for the standard output
+        """
+        BoardRenderer(self.x_dim, self.y_dim).write_numbers(file or sys.stdout, self.numbers)
 
-        :param x: integer representing the x position of the horse
-        :param y: integer representing the y position of the horse
+    def valid_move(self, x, y):
+        """
+        Check that the knight can move to a square.
 
-        :return: integer indicating the number of possible moves or
-        a list with the coordinates of possible moves
+        :param x: integer indicating the column, from 1
+        :param y: integer indicating the row, from 1
+        :return: boolean
         """
-        moves = 0
-        coordinates = []
-        for place in [(1, 2), (-1, 2), (1, -2), (-1, -2)]:
-            if (self.x_dim, self.y_dim) >= self.check(x + place[0], y + place[1]):
-                landing = self.board[-(y + place[1])][x + place[0]]  # "___"
-                if self.initial_position and landing != f"{' ' * self.cell_size}*":
-                    self.board[-(y + place[1])][x + place[0]] = f"{' ' * self.cell_size}A"
-                    coordinates.append([x + place[0], y + place[1]])
-                elif landing == f"{'_' * (self.cell_size + 1)}":
-                    moves += 1
+        return self.knight_board.index(x, y) in self.hints
 
-            if (self.x_dim, self.y_dim) >= self.check(x + place[1], y + place[0]):
-                landing = self.board[-(y + place[0])][x + place[1]]
-                if self.initial_position and landing != f"{' ' * self.cell_size}*":
-                    self.board[-(y + place[0])][x + place[1]] = f"{' ' * self.cell_size}A"
-                    coordinates.append([x + place[1], y + place[0]])
-                elif landing == f"{'_' * (self.cell_size + 1)}":
-                    moves += 1
-        if self.initial_position:
-            return coordinates
-        return moves
+    def cell(self, x, y):
+        """
+        Return the string of a cell of the chessboard, from the state of the game's KnightBoard.
 
-    def check(self, x_value, y_value):
+        :param x: integer indicating the column, from 1
+        :param y: integer indicating the row, from 1
+        :return: string cell_size + 1 long
         """
-        Check that the values are within the correct range.
+        if x == self.x_pos and y == self.y_pos:
+            return f"{' ' * self.cell_size}X"
+        knight_board = self.knight_board
+        index = knight_board.index(x, y)
+        if index in self.hints:
+            return f"{' ' * self.cell_size}{knight_board.degree[index]}"
+        if knight_board.visited[index]:
+            return f"{' ' * self.cell_size}*"
+        return self.renderer.empty
 
-        :param x_value: integer indicating the knight's position in x
-        :param y_value: integer indicating the knight's position in y
-        :return: A tuple with the same values if they are within the correct range, otherwise it returns
-        larger dimensions to prevent the condition from passing in the method self.possible_moves
+    def row_text(self, y):
         """
+        Return the cells of a row of the chessboard, as self.cell gives them, already joined.
 
-        if x_value not in range(1, self.x_dim + 1) or y_value not in range(1, self.y_dim + 1):
-            return self.x_dim + 1, self.y_dim + 1
-        return x_value, y_value
+        The cells are written from the visited flags of the row at once, and the hints and the
+        knight over them.
 
-    def best_moves(self):
+        :param y: integer indicating the row, from 1
+        :return: string
         """
-        Show the best moves for the current position.
+        knight_board = self.knight_board
+        start = knight_board.index(1, y)
+        text = knight_board.visited[start:start + self.x_dim].translate(VISITED_MARKS).decode()
+        text = text.replace("_", f"{self.renderer.empty} ").replace("*", f"{' ' * self.cell_size}* ")[:-1]
+        cells = {index - start: f"{' ' * self.cell_size}{knight_board.degree[index]}"
+                 for index in self.hints if start <= index < start + self.x_dim}
+        if y == self.y_pos:
+            cells[self.x_pos - 1] = f"{' ' * self.cell_size}X"
+        width = self.cell_size + 2
+        for column, cell in cells.items():
+            text = f"{text[:column * width]}{cell}{text[column * width + width - 1:]}"
+        return text
 
-        Warnsdorff's rule is a strategy that helps choose the best move based on the knight's position and
-        the board status. To apply it, we need to do the following:
-        - Check if each of the eight knight's moves is possible;
-        - Check how many moves are possible from that landing position.
+    def redraw_cell(self, x, y):
         """
-        available_moves = list()
-        if self.initial_position:
-            available_moves = self.possible_moves(self.x_pos, self.y_pos)
-            self.initial_position = False
-            if not available_moves:
-                return available_moves
+        Mark a cell of the chessboard to be written again by the next draw_board.
 
-        top_moves = dict()
-        for x, y in available_moves:
-            num_moves = self.possible_moves(x, y)
-            if not self.solution_found:
-                top_moves[num_moves] = [x, y]
-            else:
-                self.board[-y][x] = f"{' ' * self.cell_size}{num_moves}"
+        :param x: integer indicating the column, from 1
+        :param y: integer indicating the row, from 1
+        """
+        self.changed_cells.add((x, y))
 
-        if not self.solution_found:
-            best_x, best_y = top_moves[min(top_moves)]
-            return best_x, best_y, available_moves
+    def draw_board(self):
+        """
+        Print the chessboard in a single write. The rows are built once, after that only the
+        cells marked by redraw_cell are written again into them.
+        With self.viewport set, only the squares that many around the knight are drawn.
+        """
+        renderer = self.renderer
+        if self.viewport is not None:
+            columns, rows = renderer.window(self.x_pos, self.y_pos, self.viewport)
+            sys.stdout.write(renderer.frame(self.cell, columns, rows))
+            self.changed_cells.clear()
+            return
+        if self.lines is None:
+            self.lines = [renderer.row(y, [self.row_text(y)]) for y in range(self.y_dim, 0, -1)]
         else:
-            self.print_board()
-            return available_moves
+            lines, width = self.lines, self.cell_size + 1
+            for x, y in self.changed_cells:
+                line, start = lines[self.y_dim - y], renderer.offset(x)
+                lines[self.y_dim - y] = f"{line[:start]}{self.cell(x, y)}{line[start + width:]}"
+        self.changed_cells.clear()
+        print("\n".join([self.border, *self.lines, self.border, self.column_labels]))
 
-    def reset_possible_moves(self, possible_moves):
+    def show_hints(self, index):
         """
-        Reset the available moves on the board.
+        Show the number of onward moves on every square the knight can move to, and draw the board.
 
-        :param possible_moves: list containing the available moves
+        :param index: integer index of the knight's square, visited on self.knight_board
+        :return: list of integer indexes of the squares the knight can move to
         """
-        for x, y in possible_moves:
-            self.board[-y][x] = f"{'_' * (self.cell_size + 1)}"
+        knight_board = self.knight_board
+        self.hints = knight_board.moves(index)
+        for landing in self.hints:
+            self.redraw_cell(*knight_board.position(landing))
+        if self.hints:
+            self.draw_board()
+        return self.hints
+
+    def clear_hints(self):
+        """
+        Reset the squares the knight could move to on the board.
+        """
+        for landing in self.hints:
+            self.redraw_cell(*self.knight_board.position(landing))
+        self.hints = []
 
     def user_game(self):
         """
         Knight's tour puzzle user interaction
+
+        The onward moves of every square are counted on a KnightBoard, so a move only updates
+        the at most 8 squares around it, and only the rows that change are drawn again.
+        The cells are read from the KnightBoard as they are drawn, no string is kept for them.
+        The moves are kept on a stack: "undo" takes the last one back and "redo" plays it again.
+        With self.undo_dead_end set, a dead end short of a full tour can still be taken back.
         """
-        moves = self.best_moves()
-        squares_visited = 0
+        knight_board = self.knight_board = KnightBoard(self.x_dim, self.y_dim)
+        path = [knight_board.index(self.x_pos, self.y_pos)]
+        undone = []
+        knight_board.visit(path[-1])
+        moves = self.show_hints(path[-1])
         while True:
-            self.board[-self.y_pos][self.x_pos] = f"{' ' * self.cell_size}*"
-            squares_visited += 1
-            new_x, new_y = self.check_dimensions("move", "Enter your next move: ", "Invalid move!")
-            self.reset_possible_moves(moves)
-            self.x_pos = new_x
-            self.y_pos = new_y
-            self.board[-self.y_pos][self.x_pos] = f"{' ' * self.cell_size}X"
-            self.initial_position = True
-            moves = self.best_moves()
-            if not moves:
-                break
-        squares_visited += 1
-        self.print_board()
-        if squares_visited != self.x_dim * self.y_dim:
+            if moves:
+                answer = self.check_dimensions("move", "Enter your next move: ", "Invalid move!", ("undo", "redo"))
+                if answer == "undo" and len(path) == 1 or answer == "redo" and not undone:
+                    print(f"Nothing to {answer}!", end=" ")
+                    continue
+                self.clear_hints()
+            else:
+                self.draw_board()
+                # a dead end can still be taken back before the game is over
+                if not self.undo_dead_end or not 1 < len(path) < self.x_dim * self.y_dim:
+                    break
+                answer = input("Do you want to undo your last move? (y/n): ")
+                while answer not in ["n", "y"]:
+                    print("Invalid input!")
+                    answer = input("Do you want to undo your last move? (y/n): ")
+                if answer == "n":
+                    break
+                answer = "undo"
+            if answer == "undo":
+                undone.append(path.pop())
+                knight_board.leave(undone[-1])
+            else:
+                if answer == "redo":
+                    path.append(undone.pop())
+                else:
+                    path.append(knight_board.index(*answer))
+                    undone.clear()
+                knight_board.visit(path[-1])
+            self.redraw_cell(self.x_pos, self.y_pos)
+            self.x_pos, self.y_pos = knight_board.position(path[-1])
+            self.redraw_cell(self.x_pos, self.y_pos)
+            moves = self.show_hints(path[-1])
+        if len(path) != self.x_dim * self.y_dim:
             print("No more possible moves!")
-            print(f"Your knight visited {squares_visited} squares!")
+            print(f"Your knight visited {len(path)} squares!")
         else:
             print("What a great tour! Congratulations!")
 
@@ -227,50 +1338,267 @@ class Puzzle:
         """
         Find a solution to the puzzle
 
+        The tour is searched on a KnightBoard, self.numbers is only written once it is found.
+        Up to self.max_nodes squares are entered when the search has to backtrack, and the search
+        gives up after self.time_limit seconds if that is set.
+        With self.closed set, boards that BlockTour can cut into blocks get a closed tour instead.
+        Otherwise the tour is looked up in self.cache first, and stored there once found, or
+        once the search has shown there is none.
+
         :return: boolean that indicates whether a solution exists
         """
-        starting_pos = self.x_pos, self.y_pos
-        results = self.best_moves()
-        num_squares_visited = 0
-        count = 0
-        pos_squares_visited = []
-        while True:
-            count += 1
-            num_squares_visited += 1
-            self.board[-self.y_pos][self.x_pos] = f"{' ' * self.cell_size}*"
-            pos_squares_visited.append([self.x_pos, self.y_pos])
-            self.x_pos, self.y_pos = results[0], results[1]
-            self.reset_possible_moves(results[2])
-            self.board[-self.y_pos][self.x_pos] = f"{' ' * self.cell_size}X"
-            self.initial_position = True
-            results = self.best_moves()
-            if not results:
-                break
-        self.board[-self.y_pos][self.x_pos] = f"{' ' * self.cell_size}X"
-        num_squares_visited += 1
-        if num_squares_visited != self.x_dim * self.y_dim:
-            return False
-        elif not self.try_puzzle:
-            pos_squares_visited.append([self.x_pos, self.y_pos])
-            for i, (x, y) in enumerate(pos_squares_visited):
-                self.board[-y][x] = f"{' ' * ((self.cell_size + 1) - len(str(i + 1)))}{i + 1}"
-        self.x_pos, self.y_pos = starting_pos
-        self.solution_found = True
+        start = self.x_pos, self.y_pos
+        self.nodes = self.reached = 0
+        self.exhausted = False
+        if self.closed and BlockTour.fits(self.x_dim, self.y_dim):
+            path = BlockTour(self.x_dim, self.y_dim, self.workers).squares(start)
+        else:
+            found, path = self.cache.get(self.x_dim, self.y_dim, start) if self.cache is not None else (False, None)
+            if not found:
+                knight_board = shared_board(self.x_dim, self.y_dim)
+                knight_board.reset()
+                searched = knight_board.solve(knight_board.index(*start), self.max_nodes, self.time_limit)
+                self.nodes = knight_board.nodes
+                self.exhausted = knight_board.exhausted
+                self.reached = knight_board.walked
+                if searched is not None:
+                    path = list(map(knight_board.position, searched))
+                if self.cache is not None and (path is not None or not knight_board.exhausted):
+                    self.cache.put(self.x_dim, self.y_dim, start, path)
+            if path is None:
+                return False
+        if not self.try_puzzle:
+            self.numbers = array("I", bytes(4 * self.x_dim * self.y_dim))
+            for i, (x, y) in enumerate(path):
+                self.numbers[(y - 1) * self.x_dim + x - 1] = i + 1
+        self.reached = self.x_dim * self.y_dim
         return True
 
+    def count_solutions(self, closed=False):
+        """
+        Count every tour from the starting square, with a TourCounter.
+
+        :param closed: boolean, whether only closed tours are counted
+        :return: integer number of tours
+        """
+        total, self.nodes = count_tours(self.x_dim, self.y_dim, (self.x_pos, self.y_pos), closed, self.workers)
+        return total
+
+    def all_solutions(self, closed=False):
+        """
+        Yield every tour from the starting square, with a TourCounter.
+
+        :param closed: boolean, whether only closed tours are listed
+        :return: generator of lists of tuples with integer values x, y, in tour order
+        """
+        return enumerate_tours(self.x_dim, self.y_dim, (self.x_pos, self.y_pos), closed, self.workers)
+
+
+def solve_start(task):
+    """
+    Search the tour from one starting square, without a display board, in a worker process.
+
+    :param task: tuple with x_dim, y_dim, the x, y of the starting square, max_nodes and time_limit
+    :return: tuple with the solvability map entry, integer squares reached and integer squares entered
+    """
+    x_dim, y_dim, x, y, max_nodes, time_limit = task
+    puzzle = Puzzle()
+    puzzle.x_dim, puzzle.y_dim, puzzle.x_pos, puzzle.y_pos = x_dim, y_dim, x, y
+    puzzle.max_nodes, puzzle.time_limit = max_nodes, time_limit
+    if puzzle.find_solution():
+        entry = TOUR
+    else:
+        entry = UNDECIDED if puzzle.exhausted else NO_TOUR
+    return entry, puzzle.reached, puzzle.nodes
+
+
+def solvability_map(x_dim, y_dim, starts=None, workers=1, max_nodes=1_000_000, time_limit=None):
+    """
+    Search the tour from every starting square of a board, or from some of them.
+
+    A square and its mirror images on the board all have a tour or none, so only the smallest
+    of each is searched, and its answer is given to the others.
+
+    :param x_dim: integer indicating the number of columns
+    :param y_dim: integer indicating the number of rows
+    :param starts: iterable of tuples with integer values x, y, None for every square
+    :param workers: integer number of processes the squares are searched in
+    :param max_nodes: integer limit of squares entered by each backtracking search
+    :param time_limit: float limit of each backtracking search in seconds, None for no limit
+    :return: tuple with a bytearray of map entries and a list of integer squares reached, both
+    indexed by (y - 1) * x_dim + x - 1, integer searches and integer squares entered
+    """
+    if starts is None:
+        starts = [(x, y) for y in range(1, y_dim + 1) for x in range(1, x_dim + 1)]
+    own = [symmetry for symmetry in SYMMETRIES if transform(symmetry, x_dim, y_dim, 1, 1)[:2] == (x_dim, y_dim)]
+    mirrors = {}
+    for x, y in starts:
+        smallest = min(transform(symmetry, x_dim, y_dim, x, y)[2:] for symmetry in own)
+        mirrors.setdefault(smallest, []).append((x, y))
+    tasks = [(x_dim, y_dim, x, y, max_nodes, time_limit) for x, y in mirrors]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            results = list(pool.map(solve_start, tasks, chunksize=max(1, len(tasks) // (workers * 8))))
+    else:
+        results = list(map(solve_start, tasks))
+
+    entries = bytearray([NOT_ASKED]) * (x_dim * y_dim)
+    reached = [0] * (x_dim * y_dim)
+    for squares, (entry, length, _) in zip(mirrors.values(), results):
+        for x, y in squares:
+            entries[(y - 1) * x_dim + x - 1] = entry
+            reached[(y - 1) * x_dim + x - 1] = length
+    return entries, reached, len(tasks), sum(nodes for _, _, nodes in results)
+
+
+def write_map(file_name, x_dim, y_dim, entries, reached):
+    """
+    Write a solvability map: a header, a byte per square for its entry, then 4 bytes per square
+    for the squares reached from it.
+
+    :param file_name: string with the name of the file
+    :param x_dim: integer indicating the number of columns
+    :param y_dim: integer indicating the number of rows
+    :param entries: bytearray of map entries, as from solvability_map
+    :param reached: list of integer squares reached, as from solvability_map
+    """
+    with open(file_name, "wb") as file:
+        file.write(MAP_HEADER.pack(MAP_MAGIC, MAP_VERSION, x_dim, y_dim))
+        file.write(entries)
+        file.write(struct.pack(f"<{len(reached)}I", *reached))
+
+
+def read_map(file_name):
+    """
+    Read a solvability map.
+
+    :param file_name: string with the name of the file
+    :return: tuple with integer values x_dim, y_dim, a bytes of map entries and a tuple of integer
+    squares reached
+    """
+    with open(file_name, "rb") as file:
+        magic, version, x_dim, y_dim = MAP_HEADER.unpack(file.read(MAP_HEADER.size))
+        if magic != MAP_MAGIC or version != MAP_VERSION:
+            raise ValueError(f"{file_name} is not a solvability map")
+        squares = x_dim * y_dim
+        entries = file.read(squares)
+        reached = struct.unpack(f"<{squares}I", file.read(4 * squares))
+    return x_dim, y_dim, entries, reached
+
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tour", type=int, nargs=2, metavar=("X", "Y"),
+                        help="print a closed tour of an X by Y board without asking, or write it with --output")
+    parser.add_argument("--count", type=int, nargs=2, metavar=("X", "Y"),
+                        help="count every tour of an X by Y board from the starting square, up to about 6x6")
+    parser.add_argument("--start", type=int, nargs=2, metavar=("X", "Y"), default=(1, 1),
+                        help="first square of the tour")
+    parser.add_argument("--map", type=int, nargs=2, metavar=("X", "Y"),
+                        help="search the tour from every starting square of an X by Y board, or from --starts")
+    parser.add_argument("--starts", type=int, nargs="+", metavar="X Y", help="starting squares to map, as x y pairs")
+    parser.add_argument("--closed", action="store_true", help="only count closed tours")
+    parser.add_argument("--list", action="store_true", help="print every tour counted, a square list per line")
+    parser.add_argument("--output", help="binary path file to write the tour to, for boards too large to print, "
+                                         "or map file to write the solvability map to")
+    parser.add_argument("--numbers", metavar="FILE", help="text file to write the numbered tour to, a row at a time")
+    parser.add_argument("--viewport", type=int, metavar="N", help="only draw N squares around the knight while playing")
+    parser.add_argument("--undo-dead-end", action="store_true",
+                        help="offer to undo the last move when the knight has no move left")
+    parser.add_argument("--workers", type=int, default=1, help="processes finding the block tours")
+    parser.add_argument("--cache", default=CACHE_PATH, metavar="PATH", help="directory of the tours found so far")
+    parser.add_argument("--no-cache", action="store_true", help="always search for the tour")
+    args = parser.parse_args()
+
+    if args.tour:
+        x_dim, y_dim = args.tour
+        if not BlockTour.fits(x_dim, y_dim):
+            parser.error("closed tours need both sides of at least 6 and an even number of squares")
+        if not (0 < args.start[0] <= x_dim and 0 < args.start[1] <= y_dim):
+            parser.error("the starting square is not on the board")
+        if args.output:
+            block_tour = BlockTour(x_dim, y_dim, args.workers)
+            count = write_path(args.output, x_dim, y_dim, block_tour.squares(tuple(args.start)), closed=True)
+            print(f"{count} squares written to {args.output}")
+        else:
+            knight_puzzle = Puzzle()
+            knight_puzzle.x_dim, knight_puzzle.y_dim = x_dim, y_dim
+            knight_puzzle.x_pos, knight_puzzle.y_pos = args.start
+            knight_puzzle.try_puzzle = False
+            knight_puzzle.closed = True
+            knight_puzzle.workers = args.workers
+            knight_puzzle.find_solution()
+            if args.numbers:
+                with open(args.numbers, "w") as numbers_file:
+                    knight_puzzle.print_solution(numbers_file)
+                print(f"{x_dim * y_dim} squares written to {args.numbers}")
+            else:
+                print("Here's the solution!")
+                knight_puzzle.print_solution()
+        raise SystemExit
+
+    if args.count:
+        knight_puzzle = Puzzle()
+        knight_puzzle.x_dim, knight_puzzle.y_dim = args.count
+        knight_puzzle.x_pos, knight_puzzle.y_pos = args.start
+        knight_puzzle.workers = args.workers
+        if not (0 < knight_puzzle.x_pos <= knight_puzzle.x_dim and 0 < knight_puzzle.y_pos <= knight_puzzle.y_dim):
+            parser.error("the starting square is not on the board")
+        started = time.perf_counter()
+        if args.list:
+            stats = [0]
+            total = 0
+            for tour in enumerate_tours(*args.count, tuple(args.start), args.closed, args.workers, stats=stats):
+                print(" ".join(f"{x},{y}" for x, y in tour))
+                total += 1
+            knight_puzzle.nodes = stats[0]
+        else:
+            total = knight_puzzle.count_solutions(args.closed)
+        elapsed = time.perf_counter() - started
+        kind = "closed tours" if args.closed else "tours"
+        print(f"{total} {kind} from {args.start[0]} {args.start[1]} in {elapsed:.2f}s: "
+              f"{total / elapsed:,.0f} tours/s, {knight_puzzle.nodes / elapsed:,.0f} nodes/s")
+        raise SystemExit
+
+    if args.map:
+        x_dim, y_dim = args.map
+        starts = None
+        if args.starts:
+            if len(args.starts) % 2:
+                parser.error("--starts takes x y pairs")
+            starts = list(zip(args.starts[::2], args.starts[1::2]))
+            if not all(0 < x <= x_dim and 0 < y <= y_dim for x, y in starts):
+                parser.error("a starting square is not on the board")
+        started = time.perf_counter()
+        entries, reached, searches, nodes = solvability_map(x_dim, y_dim, starts, args.workers)
+        elapsed = time.perf_counter() - started
+        if args.output:
+            write_map(args.output, x_dim, y_dim, entries, reached)
+        else:
+            for y in range(y_dim, 0, -1):
+                print("".join(MAP_SYMBOLS[entry] for entry in entries[(y - 1) * x_dim:y * x_dim]))
+        asked = x_dim * y_dim - entries.count(NOT_ASKED)
+        print(f"{asked} starts, {entries.count(TOUR)} with a tour, {entries.count(NO_TOUR)} without, "
+              f"{entries.count(UNDECIDED)} undecided; {searches} searched in {elapsed:.2f}s: "
+              f"{asked / elapsed:,.0f} starts/s, {nodes / elapsed:,.0f} nodes/s")
+        raise SystemExit
+
     knight_puzzle = Puzzle()
+    knight_puzzle.viewport = args.viewport
+    knight_puzzle.undo_dead_end = args.undo_dead_end
+    if not args.no_cache:
+        knight_puzzle.cache = SolutionCache(args.cache)
 
     knight_puzzle.setup()
 
     response = knight_puzzle.find_solution()
-    if not response:
+    if not response and knight_puzzle.exhausted:
+        # running out of budget proves nothing either way
+        print(f"The search gave up after {knight_puzzle.nodes} nodes!")
+    elif not response:
         print("No solution exists!")
     elif knight_puzzle.try_puzzle:
-        knight_puzzle.board = []
-        knight_puzzle.setup_board()
         knight_puzzle.user_game()
     else:
         print("Here's the solution!")
-        knight_puzzle.print_board()
+        knight_puzzle.print_solution()
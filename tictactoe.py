@@ -1,38 +1,616 @@
+import argparse
+import functools
+import itertools
+import math
+import mmap
+import os
 import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 """
 Apply Function annotations 
 https://hyperskill.org/learn/step/15664
 """
 
+WINNING_STATES = [(0, 1, 2), (3, 4, 5), (6, 7, 8),
+                  (0, 3, 6), (1, 4, 7), (2, 5, 8),
+                  (0, 4, 8), (2, 4, 6)]
+WIN_MASKS = [sum(1 << cell for cell in triplet) for triplet in WINNING_STATES]
+FULL = (1 << 9) - 1
+
+# lookup tables over every 9-bit set of cells
+WINS = [any(bits & mask == mask for mask in WIN_MASKS) for bits in range(FULL + 1)]
+MOVES = [[cell for cell in range(9) if bits >> cell & 1] for bits in range(FULL + 1)]
+# moves in search order: center, corners, then edges
+ORDER = [4, 0, 2, 6, 8, 1, 3, 5, 7]
+ORDERED_MOVES = [[cell for cell in ORDER if bits >> cell & 1] for bits in range(FULL + 1)]
+
+
+def transform(cell, turns, mirror):
+    row, col = divmod(cell, 3)
+    if mirror:
+        col = 2 - col
+    for _ in range(turns):
+        row, col = col, 2 - row
+    return row * 3 + col
+
+
+# the 8 symmetries of the square, as cell permutations and as tables over 9-bit sets
+SYMMETRIES = [[transform(cell, turns, mirror) for cell in range(9)] for mirror in (False, True) for turns in range(4)]
+INVERSES = [[permutation.index(cell) for cell in range(9)] for permutation in SYMMETRIES]
+SYMMETRIC_BITS = [[sum(1 << permutation[cell] for cell in MOVES[bits]) for bits in range(FULL + 1)]
+                  for permutation in SYMMETRIES]
+
+
+def canonical(me, opp):
+    # the smallest key among the 8 images of the position, and the symmetry that gives it
+    return min(((table[me] << 9 | table[opp]), symmetry) for symmetry, table in enumerate(SYMMETRIC_BITS))
 
-class TicTac:
+
+# kinds of stored scores, alpha-beta only proves bounds for some positions
+EXACT, LOWER, UPPER = 0, 1, 2
+
+
+class TranspositionTable:
+    # (score, kind, best cell) for the player to move, keyed by canonical position
 
     def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+
+# shared by every game in the process
+TRANSPOSITIONS = TranspositionTable()
+
+# The opening book holds, for every position, the best cell (NO_MOVE if the game is over or
+# the position is unreachable) and its score for the player to move, two bytes per position
+# indexed by the base-3 number of the board (X = 1, O = 2, cell i is digit i).
+BOOK_MAGIC = b"TTTB"
+BOOK_VERSION = 2
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tictactoe.book")
+NO_MOVE = 255
+TERNARY = [sum(3 ** cell for cell in MOVES[bits]) for bits in range(FULL + 1)]
+
+
+def position_index(x, o):
+    return TERNARY[x] + 2 * TERNARY[o]
+
+
+def to_move(x, o):
+    return 'X' if len(MOVES[x]) == len(MOVES[o]) else 'O'
+
+
+def reachable_positions():
+    # every position of a game started by X that is not over yet, as (x, o)
+    seen = set()
+    stack = [(0, 0)]
+    while stack:
+        x, o = stack.pop()
+        if (x, o) in seen or WINS[x] or WINS[o] or not FULL & ~(x | o):
+            continue
+        seen.add((x, o))
+        for cell in MOVES[FULL & ~(x | o)]:
+            stack.append((x | 1 << cell, o) if to_move(x, o) == 'X' else (x, o | 1 << cell))
+    return seen
+
+
+def solve(x, o):
+    # (score, cell) for the player to move, also for positions where the game is over
+    me, opp = (x, o) if to_move(x, o) == 'X' else (o, x)
+    return negamax(me, opp, [0])
+
+
+def build_book(path=BOOK_PATH):
+    entries = bytearray([NO_MOVE, 0] * 3 ** 9)
+    positions = reachable_positions()
+    for x, o in positions:
+        score, cell = solve(x, o)
+        index = 2 * position_index(x, o)
+        entries[index], entries[index + 1] = cell, score & 0xFF
+
+    temp_name = f"{path}.tmp"
+    with open(temp_name, "wb") as file:
+        file.write(BOOK_MAGIC + bytes([BOOK_VERSION]) + entries)
+    os.replace(temp_name, path)
+    return len(positions)
+
+
+class OpeningBook:
+    # memory-mapped on the first lookup, so importing the module never touches the file
+
+    def __init__(self, path=BOOK_PATH):
+        self.path = path
+        self.entries = None
+        self.loaded = False
+
+    def load(self):
+        self.loaded = True
+        try:
+            with open(self.path, "rb") as file:
+                book = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return
+        header = len(BOOK_MAGIC) + 1
+        if book[:header] == BOOK_MAGIC + bytes([BOOK_VERSION]) and len(book) == header + 2 * 3 ** 9:
+            self.entries = memoryview(book)[header:]
+
+    def lookup(self, x, o):
+        # (cell, score) for the player to move, or None when the book can't tell
+        if not self.loaded:
+            self.load()
+        if self.entries is None:
+            return None
+        index = 2 * position_index(x, o)
+        cell, score = self.entries[index], self.entries[index + 1]
+        if cell == NO_MOVE:
+            return None
+        return cell, score - 256 if score > 127 else score
+
+
+def verify_book(book):
+    # compares every entry with a live search, returns the positions where they disagree
+    mismatches = []
+    for x, o in reachable_positions():
+        entry = book.lookup(x, o)
+        score, _ = solve(x, o)
+        if entry is None or entry[1] != score:
+            mismatches.append((x, o))
+            continue
+        cell = entry[0]
+        child_x, child_o = (x | 1 << cell, o) if to_move(x, o) == 'X' else (x, o | 1 << cell)
+        if (x | o) >> cell & 1 or -solve(child_x, child_o)[0] != score:
+            mismatches.append((x, o))
+    return mismatches
+
+
+BOOK = OpeningBook()
+
+
+class Rules:
+    # a size x size grid where win marks in a row win, with the tables the engines need.
+    # The lines are rows, columns, then both diagonals, so 3x3 gives WINNING_STATES.
+
+    def __init__(self, size, win):
+        self.size = size
+        self.win = win
+        self.cells = size * size
+        self.full = (1 << self.cells) - 1
+        self.classic = size == 3 and win == 3
+        self.lines = []
+        for row_step, col_step in ((0, 1), (1, 0), (1, 1), (1, -1)):
+            for row in range(size):
+                for col in range(size):
+                    end_row, end_col = row + row_step * (win - 1), col + col_step * (win - 1)
+                    if 0 <= end_row < size and 0 <= end_col < size:
+                        self.lines.append(tuple((row + row_step * i) * size + col + col_step * i
+                                                for i in range(win)))
+        self.windows = [sum(1 << cell for cell in line) for line in self.lines]
+        self.cell_lines = [[index for index, line in enumerate(self.lines) if cell in line] for cell in range(self.cells)]
+        # a move can only complete the lines through it
+        self.cell_windows = [[mask for mask in self.windows if mask >> cell & 1] for cell in range(self.cells)]
+        self.neighbours = [sum(1 << (r * size + c) for r in range(row - 1, row + 2) for c in range(col - 1, col + 2)
+                               if 0 <= r < size and 0 <= c < size)
+                           for row, col in map(lambda cell: divmod(cell, size), range(self.cells))]
+        self.center = (size // 2) * size + size // 2
+        # heuristic value of a line holding only one player's marks, by number of marks
+        self.weights = [0] + [4 ** count for count in range(1, win)]
+        self.gains = [after - before for before, after in zip(self.weights, self.weights[1:])]
+        self.win_score = 2 * len(self.windows) * self.weights[-1] + self.cells + 1
+
+    def evaluate(self, me, opp):
+        score = 0
+        for mask in self.windows:
+            mine, theirs = me & mask, opp & mask
+            if not theirs:
+                score += self.weights[mine.bit_count()]
+            elif not mine:
+                score -= self.weights[theirs.bit_count()]
+        return score
+
+
+@functools.lru_cache(maxsize=None)
+def board_rules(size=3, win=3):
+    return Rules(size, win)
+
+
+class Board:
+    # two integers, one per player, bit i is cell i of the grid, row by row. Alongside them the
+    # empty cells are kept in a list (with the slot of each cell in it, so a cell is removed by
+    # swapping in the last one), and each line counts its X and O marks. A threat is a line that
+    # one player fills but for a single empty cell.
+
+    def __init__(self, size=3, win=3):
+        self.rules = board_rules(size, win)
+        self.clear()
+
+    def clear(self):
+        rules = self.rules
+        self.x = 0
+        self.o = 0
+        self.last = None
+        self.free_cells = list(range(rules.cells))
+        self.slots = list(range(rules.cells))
+        self.x_counts = [0] * len(rules.windows)
+        self.o_counts = [0] * len(rules.windows)
+        self.threats = set(range(len(rules.windows))) if rules.win == 1 else set()
+
+    def set_position(self, x, o):
+        rules = self.rules
+        self.x = x
+        self.o = o
+        self.last = None
+        self.free_cells = [cell for cell in range(rules.cells) if not (x | o) >> cell & 1]
+        self.slots = [None] * rules.cells
+        for slot, cell in enumerate(self.free_cells):
+            self.slots[cell] = slot
+        self.x_counts = [(x & mask).bit_count() for mask in rules.windows]
+        self.o_counts = [(o & mask).bit_count() for mask in rules.windows]
+        self.threats = set()
+        for line in range(len(rules.windows)):
+            self.update_threat(line)
+
+    def update_threat(self, line):
+        x_count, o_count = self.x_counts[line], self.o_counts[line]
+        near_win = self.rules.win - 1
+        if x_count == near_win and not o_count or o_count == near_win and not x_count:
+            self.threats.add(line)
+        else:
+            self.threats.discard(line)
+
+    def bits(self, marker):
+        return self.x if marker == 'X' else self.o
+
+    def cell(self, pos):
+        if self.x >> pos & 1:
+            return 'X'
+        if self.o >> pos & 1:
+            return 'O'
+        return '_'
+
+    @property
+    def cells(self):
+        return [self.cell(pos) for pos in range(self.rules.cells)]
+
+    def empty(self):
+        return self.rules.full & ~(self.x | self.o)
+
+    def wins(self, marker):
+        bits = self.bits(marker)
+        if self.rules.classic:
+            return WINS[bits]
+        # only the last move can have completed a line
+        return self.last is not None and any(bits & mask == mask for mask in self.rules.cell_windows[self.last])
+
+    def random_cell(self):
+        return random.choice(self.free_cells)
+
+    def play(self, pos, marker):
+        if marker == 'X':
+            self.x |= 1 << pos
+            counts, other_counts = self.x_counts, self.o_counts
+        else:
+            self.o |= 1 << pos
+            counts, other_counts = self.o_counts, self.x_counts
+        self.last = pos
+
+        slot, last_cell = self.slots[pos], self.free_cells.pop()
+        if last_cell != pos:
+            self.free_cells[slot] = last_cell
+            self.slots[last_cell] = slot
+        self.slots[pos] = None
+
+        # a line becomes a threat only through the mover's marks, any other change ends one
+        near_win, threats = self.rules.win - 1, self.threats
+        for line in self.rules.cell_lines[pos]:
+            count = counts[line] + 1
+            counts[line] = count
+            if count == near_win and not other_counts[line]:
+                threats.add(line)
+            else:
+                threats.discard(line)
+
+
+def negamax(me, opp, counter, table=TRANSPOSITIONS, alpha=-100, beta=100):
+    # score for the player to move (me), opp has just moved. A win scores 10 minus the number
+    # of moves played, so faster wins (and slower losses) are preferred, a draw scores 0.
+    # Returns (score, cell), exact when the score lies strictly between alpha and beta.
+    counter[0] += 1
+    free = FULL & ~(me | opp)
+    if WINS[opp]:
+        return -1 - len(MOVES[free]), None
+    if not free:
+        return 0, None
+
+    key, symmetry = canonical(me, opp)
+    entry = table.entries.get(key)
+    moves = ORDERED_MOVES[free]
+    if entry is not None:
+        score, kind, cell = entry
+        cell = INVERSES[symmetry][cell]
+        if kind == EXACT or kind == LOWER and score >= beta or kind == UPPER and score <= alpha:
+            table.hits += 1
+            return score, cell
+        # not enough to cut, but the stored move is searched first
+        moves = [cell] + [move for move in moves if move != cell]
+    table.misses += 1
+
+    best_score, best_cell = -100, None
+    start_alpha = alpha
+    for cell in moves:
+        score = -negamax(opp, me | 1 << cell, counter, table, -beta, -alpha)[0]
+        if score > best_score:
+            best_score, best_cell = score, cell
+            alpha = max(alpha, score)
+            if alpha >= beta:
+                break
+
+    if best_score <= start_alpha:
+        kind = UPPER
+    elif best_score >= beta:
+        kind = LOWER
+    else:
+        kind = EXACT
+    table.entries[key] = best_score, kind, SYMMETRIES[symmetry][best_cell]
+    return best_score, best_cell
+
+
+class SearchTimeout(Exception):
+    pass
+
+
+def alphabeta(rules, me, opp, near, score, depth, alpha, beta, search):
+    # depth-limited negamax for boards too large to solve. score is the heuristic value of the
+    # position for me, updated by each move from the lines through it. near holds the cells
+    # next to a mark, the only ones searched. A win scores rules.win_score minus the marks on
+    # the board. search is (table, counter, deadline).
+    table, counter, deadline = search
+    counter[0] += 1
+    if counter[0] & 255 == 0 and time.perf_counter() > deadline:
+        raise SearchTimeout
+    free = rules.full & ~(me | opp)
+    if not free:
+        return 0, None
+    if depth == 0:
+        return score, None
+
+    entry = table.get((me, opp))
+    hint = None
+    if entry is not None:
+        entry_depth, entry_score, kind, cell = entry
+        if entry_depth >= depth and (kind == EXACT or kind == LOWER and entry_score >= beta
+                                     or kind == UPPER and entry_score <= alpha):
+            return entry_score, cell
+        hint = cell
+
+    children = []
+    candidates = near & free or (1 << rules.center if free >> rules.center & 1 else free)
+    while candidates:
+        bit = candidates & -candidates
+        candidates ^= bit
+        cell = bit.bit_length() - 1
+        delta = 0
+        for mask in rules.cell_windows[cell]:
+            mine, theirs = me & mask, opp & mask
+            if theirs:
+                if not mine:
+                    # the move blocks a line of the opponent
+                    delta += rules.weights[theirs.bit_count()]
+                continue
+            count = mine.bit_count()
+            if count + 1 == rules.win:
+                return rules.win_score - (me | opp).bit_count(), cell
+            delta += rules.gains[count]
+        children.append((cell == hint, delta, cell))
+    # the stored move first, then the moves that change the evaluation the most
+    children.sort(reverse=True)
+
+    best_score, best_cell = -rules.win_score, None
+    start_alpha = alpha
+    for _, delta, cell in children:
+        value = -alphabeta(rules, opp, me | 1 << cell, near | rules.neighbours[cell], -score - delta, depth - 1,
+                           -beta, -alpha, search)[0]
+        if value > best_score:
+            best_score, best_cell = value, cell
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+    if best_score <= start_alpha:
+        kind = UPPER
+    elif best_score >= beta:
+        kind = LOWER
+    else:
+        kind = EXACT
+    table[me, opp] = depth, best_score, kind, best_cell
+    return best_score, best_cell
+
+
+def deepening(rules, me, opp, budget, counter):
+    # searches one move deeper at a time until budget seconds are spent, the move of the last
+    # finished depth is played. The first depth always finishes.
+    table = {}
+    near = 0
+    for cell in range(rules.cells):
+        if (me | opp) >> cell & 1:
+            near |= rules.neighbours[cell]
+    score = rules.evaluate(me, opp)
+    free = (rules.full & ~(me | opp)).bit_count()
+    best = None
+    start = time.perf_counter()
+    for depth in range(1, free + 1):
+        deadline = start + budget if best is not None else float("inf")
+        try:
+            value, cell = alphabeta(rules, me, opp, near, score, depth, -rules.win_score, rules.win_score,
+                                    (table, counter, deadline))
+        except SearchTimeout:
+            break
+        best = cell
+        if abs(value) > rules.win_score - rules.cells - 1:
+            # the game is decided
+            break
+    return best
+
+
+def completes(rules, bits, cell):
+    # whether the marks in bits, the last one on cell, make a line
+    if rules.classic:
+        return WINS[bits]
+    for mask in rules.cell_windows[cell]:
+        if bits & mask == mask:
+            return True
+    return False
+
+
+def playout(rules, to_move, moved, buffer, draw=random.random):
+    # random moves to the end of the game, with the empty cells shuffled through a reused buffer.
+    # Returns 1 if moved (the player who made the last move) wins, 0 if to_move wins, 0.5 for a draw.
+    count = 0
+    free = rules.full & ~(to_move | moved)
+    while free:
+        bit = free & -free
+        free ^= bit
+        buffer[count] = bit.bit_length() - 1
+        count += 1
+
+    mover, other, side = to_move, moved, 0
+    while count:
+        pick = int(draw() * count)
+        cell = buffer[pick]
+        count -= 1
+        buffer[pick] = buffer[count]
+        bits = mover | 1 << cell
+        if completes(rules, bits, cell):
+            return float(side)
+        mover, other, side = other, bits, 1 - side
+    return 0.5
+
+
+def tree_moves(rules, me, opp):
+    # on large boards only the cells next to a mark are worth a node of their own
+    free = rules.full & ~(me | opp)
+    if rules.size > 5:
+        near = 0
+        taken = me | opp
+        while taken:
+            bit = taken & -taken
+            taken ^= bit
+            near |= rules.neighbours[bit.bit_length() - 1]
+        free = near & free or 1 << rules.center & free or free
+    return list(MOVES[free]) if rules.classic else [cell for cell in range(rules.cells) if free >> cell & 1]
+
+
+class MctsNode:
+    # wins are counted for the player who made move, a draw counts half
+
+    __slots__ = ("move", "parent", "children", "untried", "visits", "wins", "result")
+
+    def __init__(self, move, parent):
+        self.move = move
+        self.parent = parent
+        self.children = []
+        self.untried = []
+        self.visits = 0
+        self.wins = 0.0
+        self.result = None  # the value of a finished game, for the player who made move
+
+
+EXPLORATION = math.sqrt(2)
+
+
+def mcts(rules, me, opp, playouts=None, seconds=None, rng=random):
+    # Monte Carlo tree search for the player to move (me), limited by a number of playouts or by
+    # seconds. Returns {cell: visits} for the moves from the position and the playouts run.
+    root = MctsNode(None, None)
+    root.untried = tree_moves(rules, me, opp)
+    buffer = [0] * rules.cells
+    draw = rng.random
+    deadline = time.perf_counter() + seconds if seconds else None
+    done = 0
+    while playouts is None or done < playouts:
+        if deadline is not None and done & 15 == 0 and done and time.perf_counter() > deadline:
+            break
+        node, to_move, moved = root, me, opp
+        while node.result is None and not node.untried and node.children:
+            scale = EXPLORATION * math.sqrt(math.log(node.visits))
+            best, best_value = None, -1.0
+            for child in node.children:
+                value = child.wins / child.visits + scale / math.sqrt(child.visits)
+                if value > best_value:
+                    best, best_value = child, value
+            node = best
+            to_move, moved = moved, to_move | 1 << node.move
+
+        if node.result is None and node.untried:
+            pick = int(draw() * len(node.untried))
+            cell = node.untried[pick]
+            node.untried[pick] = node.untried[-1]
+            node.untried.pop()
+            to_move, moved = moved, to_move | 1 << cell
+            child = MctsNode(cell, node)
+            if completes(rules, moved, cell):
+                child.result = 1.0
+            elif not rules.full & ~(to_move | moved):
+                child.result = 0.5
+            else:
+                child.untried = tree_moves(rules, to_move, moved)
+            node.children.append(child)
+            node = child
+
+        value = node.result if node.result is not None else playout(rules, to_move, moved, buffer, draw)
+        done += 1
+        while node is not None:
+            node.visits += 1
+            node.wins += value
+            value = 1.0 - value
+            node = node.parent
+    return {child.move: child.visits for child in root.children}, done
+
+
+def mcts_worker(task):
+    # one process of a parallel search, with its own tree and its own seed
+    size, win, me, opp, playouts, seconds, seed = task
+    return mcts(board_rules(size, win), me, opp, playouts, seconds, random.Random(seed))
+
+
+class TicTac:
+
+    def __init__(self, size=3, win=3, budget=1.0, playouts=None, mcts_workers=1):
         self.human_player = None
         self.ai_player = None
-        self.level = 'easy'
-        self.cells = ['_'] * 9
-        self.options = {'start', 'easy', 'user', 'medium', 'hard'}
+        self.board = Board(size, win)
+        self.budget = budget  # seconds per move for the hard level beyond 3x3, and for mcts
+        self.playouts = playouts  # playouts per move for mcts instead of the time budget
+        self.mcts_workers = mcts_workers
+        self.mcts_pool = None
+        self.mcts_stats = [0, 0.0]  # playouts run and seconds spent by mcts
+        self.options = {'start', 'easy', 'user', 'medium', 'hard', 'mcts'}
+        # each computer player moves at its own level
         self.actions = {'user': self.user_move,
-                        'easy': self.pc_move,
-                        'medium': self.pc_move,
-                        'hard': self.pc_move}
-        self.winning_states = [(0, 1, 2), (3, 4, 5), (6, 7, 8),
-                               (0, 3, 6), (1, 4, 7), (2, 5, 8),
-                               (0, 4, 8), (2, 4, 6)]
+                        'easy': functools.partial(self.pc_move, level='easy'),
+                        'medium': functools.partial(self.pc_move, level='medium'),
+                        'hard': functools.partial(self.pc_move, level='hard'),
+                        'mcts': functools.partial(self.pc_move, level='mcts')}
+        self.nodes = [0]  # positions searched by minimax
+
+    @property
+    def cells(self):
+        # a read-only view of the board, used for display
+        return self.board.cells
 
     @staticmethod
     def check_state(board, player1, player2, show_outcome):
-        states = [board[0:7:3], board[1:8:3], board[2:9:3]]
-        states.extend([board[:3], board[3:6], board[6:9]])
-        states.extend([board[0:9:4], board[2:7:2]])
-
-        if [player1] * 3 in states:
+        if board.wins(player1):
             return f"{player1} wins" if show_outcome else 'Win'
-        elif [player2] * 3 in states:
+        elif board.wins(player2):
             return f"{player2} wins" if show_outcome else 'Loss'
-        elif '_' in board:
+        elif board.empty():
             # 'Game not finished'
             return None
         else:
@@ -53,119 +631,134 @@ class TicTac:
                 print('Bad parameters!')
 
     def show_table(self):
-        print('---------')
-        for row in [self.cells[:3], self.cells[3:6], self.cells[6:9]]:
+        cells = self.cells
+        size = self.board.rules.size
+        print('-' * (2 * size + 3))
+        for row in [cells[start:start + size] for start in range(0, len(cells), size)]:
             print('|', end=' ')
             print(*row, end=' ')
             print('|', end=' ')
             print()
-        print('---------')
+        print('-' * (2 * size + 3))
 
     def user_move(self, marker):
+        size = self.board.rules.size
         while True:
             try:
                 x, y = input('Enter the coordinates: ').split()
                 x, y = int(x), int(y)
-                if x in range(1, 4) and y in range(1, 4):
-                    pos = (x - 1) * 3 + (y - 1)
-                    if self.cells[pos] != "_":
+                if x in range(1, size + 1) and y in range(1, size + 1):
+                    pos = (x - 1) * size + (y - 1)
+                    if self.board.cell(pos) != "_":
                         print('This cell is occupied! Choose another one!')
                     else:
-                        self.cells[pos] = marker
+                        self.board.play(pos, marker)
                         break
-                print('Coordinates should be from 1 to 3!')
+                print(f'Coordinates should be from 1 to {size}!')
             except ValueError:
                 print('You should enter numbers!')
 
-    def minimax(self, new_cells, current_player):
-        state = self.check_state(new_cells, self.ai_player, self.human_player, show_outcome=False)
-        # check for the terminal states and return a value accordingly
-        if state == 'Loss':
-            return {"score": -10}
-        elif state == 'Win':
-            return {"score": 10}
-        elif state == 'Draw':
-            return {"score": 0}
-
-        # an array to collect all the objects
-        moves = []
-        for i, cell in enumerate(new_cells):
-            if cell == '_':
-                move = {"index": i}
-                new_cells[i] = current_player
-
-                if current_player == self.ai_player:
-                    result = self.minimax(new_cells, self.human_player)
-                else:
-                    result = self.minimax(new_cells, self.ai_player)
-                move["score"] = result["score"]
-
-                new_cells[i] = cell
-
-                moves.append(move)
-
-        top_move = None
-        if current_player == self.ai_player:
-            best_score = -10000
-            for i, move in enumerate(moves):
-                if move["score"] > best_score:
-                    best_score = move["score"]
-                    top_move = i
+    def minimax(self, board, current_player):
+        # scores are from the AI's point of view, as in {"index": cell, "score": score}
+        if current_player == 'X':
+            me, opp = board.x, board.o
         else:
-            best_score = 10000
-            for i, move in enumerate(moves):
-                if move["score"] < best_score:
-                    best_score = move["score"]
-                    top_move = i
+            me, opp = board.o, board.x
+        score, cell = negamax(me, opp, self.nodes)
+        if current_player != self.ai_player:
+            score = -score
+        if cell is None:
+            return {"score": score}
+        return {"index": cell, "score": score}
+
+    def book_move(self, marker):
+        x, o = self.board.x, self.board.o
+        entry = BOOK.lookup(x, o) if to_move(x, o) == marker else None
+        if entry is not None:
+            return entry[0]
+        move_dict = self.minimax(self.board, marker)
+        return move_dict["index"]
 
-        return moves[top_move]
+    def search_move(self, marker):
+        # boards too large to solve are searched as deep as the time budget allows
+        me, opp = (self.board.x, self.board.o) if marker == 'X' else (self.board.o, self.board.x)
+        return deepening(self.board.rules, me, opp, self.budget, self.nodes)
+
+    def mcts_move(self, marker):
+        # with several workers each searches its own tree and the visits of their moves are added
+        rules = self.board.rules
+        me, opp = (self.board.x, self.board.o) if marker == 'X' else (self.board.o, self.board.x)
+        seconds = None if self.playouts else self.budget
+        start = time.perf_counter()
+        if self.mcts_workers > 1:
+            if self.mcts_pool is None:
+                self.mcts_pool = ProcessPoolExecutor(self.mcts_workers)
+            share = self.playouts and -(-self.playouts // self.mcts_workers)
+            tasks = [(rules.size, rules.win, me, opp, share, seconds, random.random())
+                     for _ in range(self.mcts_workers)]
+            visits, done = {}, 0
+            for worker_visits, worker_done in self.mcts_pool.map(mcts_worker, tasks):
+                for cell, count in worker_visits.items():
+                    visits[cell] = visits.get(cell, 0) + count
+                done += worker_done
+        else:
+            visits, done = mcts(rules, me, opp, self.playouts, seconds)
+        self.mcts_stats[0] += done
+        self.mcts_stats[1] += time.perf_counter() - start
+        return max(visits, key=visits.get)
 
     def best_move(self):
-        move = None
-        for triplet in self.winning_states:
-            cell1, cell2, cell3 = triplet
-            state = self.cells[cell1] + self.cells[cell2] + self.cells[cell3]
-            if '_' in state and \
-                    (state.count('X') == 2 or state.count('O') == 2):
-                move = triplet[state.index('_')]
-
-        if not move:
-            move = random.randrange(0, 9)
-        return move
-
-    def pc_move(self, marker):
-        print(f'Making move level "{self.level}"')
-        while True:
-            if self.level == "medium":
-                move = self.best_move()
-            elif self.level == "hard":
-                move_dict = self.minimax(self.cells, marker)
-                move = move_dict["index"]
-            else:
-                move = random.randrange(0, 9)
+        # the empty cell of the last threatened line, as a win or a block, else a random cell
+        board = self.board
+        if board.threats:
+            free = board.rules.windows[max(board.threats)] & ~(board.x | board.o)
+            return free.bit_length() - 1
+        return board.random_cell()
 
-            if self.cells[move] != "_":
-                # This cell is occupied! Choose another one!
-                continue
-            else:
-                self.cells[move] = marker
-                break
+    def choose_move(self, level, marker):
+        # the computer's move at a level, without any output
+        if level == "medium":
+            return self.best_move()
+        elif level == "hard":
+            return self.book_move(marker) if self.board.rules.classic else self.search_move(marker)
+        elif level == "mcts":
+            return self.mcts_move(marker)
+        return self.board.random_cell()
+
+    def pc_move(self, marker, level):
+        print(f'Making move level "{level}"')
+        self.board.play(self.choose_move(level, marker), marker)
+
+    def headless_game(self, x_level, o_level):
+        # plays a whole game on a fresh board with no output, returns the winner or None for a draw
+        self.board.clear()
+        levels = {'X': x_level, 'O': o_level}
+        marker, other = 'X', 'O'
+        while True:
+            self.board.play(self.choose_move(levels[marker], marker), marker)
+            if self.board.wins(marker):
+                return marker
+            if not self.board.empty():
+                return None
+            marker, other = other, marker
 
     def pvp(self, p1_move, p2_move):
+        # nobody can win before the first player has placed win marks
+        first_win = 2 * self.board.rules.win - 1
         turn = 0
         while True:
             self.actions[p1_move]('X')
             self.show_table()
             turn += 1
-            state = self.check_state(self.cells, 'X', 'O', show_outcome=True)
-            if turn >= 5 and state:
+            state = self.check_state(self.board, 'X', 'O', show_outcome=True)
+            if turn >= first_win and state:
                 print(state)
                 break
             self.actions[p2_move]('O')
             self.show_table()
             turn += 1
-            state = self.check_state(self.cells, 'O', 'X', show_outcome=True)
-            if turn >= 5 and state:
+            state = self.check_state(self.board, 'O', 'X', show_outcome=True)
+            if turn >= first_win and state:
                 print(state)
                 break
 
@@ -174,17 +767,104 @@ class TicTac:
 
         if commands[0] != 'exit':
             self.show_table()
-            if 'medium' in commands:
-                self.level = 'medium'
-            elif 'hard' in commands:
-                self.level = 'hard'
+            if 'hard' in commands:
                 self.ai_player, self.human_player = ('X', 'O') if 'hard' == commands[1] else ('O', 'X')
             self.pvp(commands[1], commands[2])
 
 
+def tournament_chunk(task):
+    # one process plays a chunk of games of a pairing, seeded from the task alone so the
+    # results don't depend on which process runs it. Returns [X wins, draws, O wins].
+    x_level, o_level, games, seed, size, win, budget, playouts = task
+    random.seed(seed)
+    game = TicTac(size, win, budget, playouts)
+    outcome = {'X': 0, None: 1, 'O': 2}
+    results = [0, 0, 0]
+    for _ in range(games):
+        results[outcome[game.headless_game(x_level, o_level)]] += 1
+    return results
+
+
+def tournament(levels, games, workers=None, seed=0, size=3, win=3, budget=1.0, playouts=None, chunk=10_000):
+    # every level plays every level, including itself, with both markers.
+    # Returns {(x_level, o_level): [X wins, draws, O wins]} and the elapsed seconds.
+    pairings = list(itertools.product(levels, repeat=2))
+    tasks = []
+    for x_level, o_level in pairings:
+        for start in range(0, games, chunk):
+            tasks.append((x_level, o_level, min(chunk, games - start), f"{seed}-{x_level}-{o_level}-{start}",
+                          size, win, budget, playouts))
+
+    totals = {pairing: [0, 0, 0] for pairing in pairings}
+    start = time.perf_counter()
+    with ProcessPoolExecutor(workers) as pool:
+        for task, results in zip(tasks, pool.map(tournament_chunk, tasks)):
+            total = totals[task[0], task[1]]
+            for i, count in enumerate(results):
+                total[i] += count
+    return totals, time.perf_counter() - start
+
+
+def print_tournament(totals, elapsed):
+    print("X         O            X wins     draws    O wins")
+    for (x_level, o_level), (x_wins, draws, o_wins) in totals.items():
+        games = x_wins + draws + o_wins
+        print(f"{x_level:<9} {o_level:<9} {x_wins / games:>9.1%} {draws / games:>9.1%} {o_wins / games:>9.1%}")
+
+    # each level over all its games, with either marker
+    records = {}
+    for (x_level, o_level), (x_wins, draws, o_wins) in totals.items():
+        for level, won, lost in ((x_level, x_wins, o_wins), (o_level, o_wins, x_wins)):
+            record = records.setdefault(level, [0, 0, 0])
+            record[0] += won
+            record[1] += draws
+            record[2] += lost
+    print()
+    print("level          wins     draws    losses")
+    for level, (won, draws, lost) in records.items():
+        print(f"{level:<9} {won:>9} {draws:>9} {lost:>9}")
+
+    played = sum(map(sum, totals.values()))
+    print(f"\n{played:,} games in {elapsed:.2f}s: {played / elapsed:,.0f} games/s")
+
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tic-tac-toe against the computer.")
+    parser.add_argument("--build-book", nargs="?", const=BOOK_PATH, metavar="PATH",
+                        help="solve every position and write the opening book used by the hard level")
+    parser.add_argument("--verify-book", nargs="?", const=BOOK_PATH, metavar="PATH",
+                        help="check every opening book entry against a live minimax search")
+    parser.add_argument("--size", type=int, default=3, help="play on a SIZE x SIZE board")
+    parser.add_argument("--win", type=int, help="marks in a row needed to win, by default up to 5")
+    parser.add_argument("--budget", type=float, default=1.0,
+                        help="seconds per move for the hard level on boards other than 3x3")
+    parser.add_argument("--tournament", nargs="+", choices=["easy", "medium", "hard", "mcts"], metavar="LEVEL",
+                        help="play the computer levels against each other without output and print the results")
+    parser.add_argument("--games", type=int, default=10_000, help="games per pairing in a tournament")
+    parser.add_argument("--workers", type=int, help="processes for a tournament, by default one per core")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for a tournament")
+    parser.add_argument("--playouts", type=int, help="playouts per move for the mcts level instead of --budget")
+    parser.add_argument("--mcts-workers", type=int, default=1, help="processes searching each mcts move")
+    args = parser.parse_args()
+    win = args.win or min(args.size, 5)
+    if not 1 <= win <= args.size:
+        parser.error("--win must be between 1 and the board size")
+
+    if args.build_book:
+        print(f"{build_book(args.build_book)} positions written to {args.build_book}")
+        sys.exit()
+    if args.verify_book:
+        errors = verify_book(OpeningBook(args.verify_book))
+        print(f"{len(errors)} positions disagree with minimax" if errors else "The opening book matches minimax.")
+        sys.exit(1 if errors else 0)
+
+    if args.tournament:
+        print_tournament(*tournament(args.tournament, args.games, args.workers, args.seed, args.size, win,
+                                     args.budget, args.playouts))
+        sys.exit()
+
     print("Input 3 words/commands, the first one must be 'start'")
-    print("the next 2 could be 'easy', 'user', 'medium' or 'hard'")
+    print("the next 2 could be 'easy', 'user', 'medium', 'hard' or 'mcts'")
     print("the only command for human interaction is 'user'.\n")
-    new_game = TicTac()
+    new_game = TicTac(args.size, win, args.budget, args.playouts, args.mcts_workers)
     new_game.start()